@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+from render.scene import Scene
+
+
+def render_all_frames(scene: Scene) -> int:
+    """Renders every frame of ``scene`` and returns the amount of frames.
+
+    Frame coalescing is turned off, otherwise the frames of benchmarks that draw the same thing on every frame
+    would be merged into one and only a single render would be measured."""
+    scene.coalesce_frames = False
+    return sum(1 for _ in scene)
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import time
+
+from PIL import Image
+
+from render.scene import Scene
+
+from common import render_all_frames
+
+# compares drawing unscaled, unrotated images through the direct composite fast path
+# against resampling them with an affine transform over the whole canvas
+
+
+def make_scene(count, blit_optimization):
+    class BenchmarkScene(Scene):
+        def lifecycle(self, t):
+            self.width = 1024
+            self.height = 1024
+
+            sticker = Image.new("RGB", (32, 32), (255, 0, 0))
+
+            for index in range(count):
+                image = self.create_image(sticker, blit_optimization=blit_optimization)
+                image.transform.position = (index * 37 % 992, index * 53 % 992)
+                self.draw_object(image)
+
+            self.create_tween("linear", lambda _: None, duration=1)
+
+            return 0
+
+    return BenchmarkScene()
+
+
+for count in (1, 10, 50):
+    for blit_optimization in (False, True):
+        scene = make_scene(count, blit_optimization)
+        frames = render_all_frames(scene)
+
+        print(f"{count:>3} images {'blit' if blit_optimization else 'transform':>9}: "
+              f"{scene.render_time / frames * 1000:8.3f}ms per frame")
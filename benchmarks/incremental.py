@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from PIL import Image
+
+from render.scene import Scene
+
+# compares full and incremental rendering of a mostly static scene:
+# a background, a few rotated stickers and a single small animated element
+
+
+def make_scene(incremental_rendering):
+    class BenchmarkScene(Scene):
+        def lifecycle(self, t):
+            self.width = 1024
+            self.height = 1024
+            self.incremental_rendering = incremental_rendering
+
+            background = self.create_image(Image.radial_gradient("L").resize((1024, 1024)).convert("RGB"))
+            self.draw_object(background)
+
+            sticker = Image.new("RGBA", (64, 64), (255, 0, 0, 200))
+
+            for index in range(20):
+                image = self.create_image(sticker, z=1)
+                image.transform.position = (index * 47 % 960, index * 131 % 960)
+                image.transform.angle = index / 10
+                self.draw_object(image)
+
+            rect = self.create_rectangle(32, 32, (0, 0, 255), z=2)
+            self.draw_object(rect)
+
+            def u(value):
+                rect.transform.position = (value, 500)
+
+            self.create_tween("easeInOutQuad", u, duration=2, begin_value=0, end_value=900)
+
+            return 0
+
+    return BenchmarkScene()
+
+
+for incremental_rendering in (False, True):
+    scene = make_scene(incremental_rendering)
+    frames = sum(1 for _ in scene)
+
+    print(f"{'incremental' if incremental_rendering else 'full':>11}: {frames} frames, "
+          f"{scene.render_time / frames * 1000:8.3f}ms per frame")
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from PIL import Image
+
+from render.scene import Scene
+
+from common import render_all_frames
+
+# measures drawing an increasing amount of small masked stickers on a large canvas,
+# the cost of each masked element should follow its own size instead of the size of the canvas
+
+
+def make_scene(count, masked):
+    class BenchmarkScene(Scene):
+        def lifecycle(self, t):
+            self.width = 1024
+            self.height = 1024
+
+            sticker = Image.new("RGBA", (48, 48), (255, 0, 0, 255))
+            gradient = Image.radial_gradient("L").resize((48, 48)).convert("RGBA")
+
+            stickers = []
+
+            for index in range(count):
+                image = self.create_image(sticker)
+                image.transform.position = (index * 37 % 976, index * 53 % 976)
+
+                if masked:
+                    image.mask = self.create_image(gradient)
+                    image.mask_channel = "R"
+
+                self.draw_object(image)
+                stickers.append(image)
+
+            def u(value):
+                for image in stickers:
+                    image.transform.angle = value
+
+            self.create_tween("linear", u, duration=0.5, begin_value=0, end_value=1)
+
+            return 0
+
+    return BenchmarkScene()
+
+
+for count in (12, 24, 48):
+    for masked in (False, True):
+        scene = make_scene(count, masked)
+        frames = render_all_frames(scene)
+
+        print(f"{count:>3} stickers {'masked' if masked else 'unmasked':>8}: "
+              f"{scene.render_time / frames * 1000:8.3f}ms per frame")
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import os
+import time
+
+from PIL import Image
+
+from render.execute import run_scene, run_scene_parallel
+from render.scene import Scene
+
+# compares rendering a 10 second clip serially against splitting it in segments over a pool of processes
+
+
+class BenchmarkScene(Scene):
+    def lifecycle(self, t):
+        self.width = 512
+        self.height = 512
+
+        background = self.create_image(Image.radial_gradient("L").resize((512, 512)).convert("RGB"))
+        self.draw_object(background)
+
+        stickers = []
+
+        for index in range(40):
+            image = self.create_image(Image.new("RGBA", (48, 48), (index * 6, 100, 200, 180)), z=1)
+            image.transform.position = (index * 47 % 464, index * 131 % 464)
+            image.transform.anchor = (24, 24)
+            self.draw_object(image)
+            stickers.append(image)
+
+        def u(value):
+            for index, image in enumerate(stickers):
+                image.transform.angle = value * (index + 1) * 0.1
+
+        self.create_tween("linear", u, duration=10)
+
+        return 0
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    run_scene(BenchmarkScene())
+    serial = time.perf_counter() - start
+
+    print(f"   serial: {serial:.3f}s")
+
+    for processes in sorted({2, 4, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        run_scene_parallel(BenchmarkScene, processes=processes)
+        parallel = time.perf_counter() - start
+
+        print(f"{processes:>2} procs: {parallel:.3f}s, {serial / parallel:.2f}x")
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import statistics
+import time
+
+from render.scene import Scene
+
+from common import render_all_frames
+
+# measures how long the scheduler takes to find the next event
+# while an increasing amount of idle components wait for an update far in the future.
+# the first event registers every component and the last one pops all of them when the scene ends,
+# only the events in between are timed.
+# with the scheduler the median should stay flat regardless of the amount of components
+
+
+def make_scene(component_count):
+    class BenchmarkScene(Scene):
+        def lifecycle(self, t):
+            self.width = 16
+            self.height = 16
+
+            def idle(_):
+                yield 1000, False
+
+            for _ in range(component_count):
+                self.create_thread(idle)
+
+            self.create_tween("linear", lambda _: None, duration=5)
+
+            return 0
+
+    return BenchmarkScene()
+
+
+def time_events(scene):
+    durations = []
+    pop_next = scene.scheduler.pop_next
+
+    def timed_pop_next(*args, **kwargs):
+        start = time.perf_counter()
+        result = pop_next(*args, **kwargs)
+        durations.append(time.perf_counter() - start)
+        return result
+
+    scene.scheduler.pop_next = timed_pop_next
+
+    render_all_frames(scene)
+
+    return durations[1:-1]
+
+
+for count in (10, 100, 1000, 10000):
+    durations = time_events(make_scene(count))
+
+    print(f"{count:>6} components: {len(durations)} events, "
+          f"{statistics.median(durations) * 1e6:8.2f}us median, {max(durations) * 1e6:8.2f}us max per event")
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import os
+
+from PIL import Image
+
+from render.scene import Scene
+
+from common import render_all_frames
+
+# compares rendering 1080p frames on a single canvas against splitting them in tiles drawn by a thread pool
+
+
+def make_scene(tile_size, render_threads):
+    class BenchmarkScene(Scene):
+        def lifecycle(self, t):
+            self.width = 1920
+            self.height = 1080
+
+            self.tile_size = tile_size
+            self.render_threads = render_threads
+
+            background = self.create_image(Image.linear_gradient("L").resize((1920, 1080)).convert("RGB"))
+            self.draw_object(background)
+
+            stickers = []
+
+            for index in range(100):
+                image = self.create_image(Image.new("RGBA", (96, 96), (index * 2, 100, 200, 180)), z=1)
+                image.transform.position = (index * 193 % 1824, index * 131 % 984)
+                image.transform.anchor = (48, 48)
+                self.draw_object(image)
+                stickers.append(image)
+
+            def u(value):
+                for index, image in enumerate(stickers):
+                    image.transform.angle = value * (index + 1) * 0.1
+
+            self.create_tween("linear", u, duration=1)
+
+            return 0
+
+    return BenchmarkScene()
+
+
+if __name__ == "__main__":
+    configurations = [(None, 1)] + [(256, threads) for threads in sorted({1, 2, 4, os.cpu_count() or 1})]
+
+    for tile_size, render_threads in configurations:
+        scene = make_scene(tile_size, render_threads)
+        frames = render_all_frames(scene)
+
+        print(f"tiles {str(tile_size):>4} threads {render_threads:>2}: "
+              f"{scene.render_time / frames * 1000:8.3f}ms per frame")
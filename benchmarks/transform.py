@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import math
+import timeit
+
+import numpy as np
+
+from render.transform import Transform
+
+# compares the 2x3 affine matrices of Transform against the 3x3 numpy matrices it used before,
+# building a matrix, composing two of them and mapping a point
+
+
+def numpy_matrix(transform):
+    translation = np.array([
+        [1, 0, transform.position[0] - transform.anchor[0]],
+        [0, 1, transform.position[1] - transform.anchor[1]],
+        [0, 0, 1]
+    ])
+
+    anchor_matrix = np.array([
+        [1, 0, transform.anchor[0]],
+        [0, 1, transform.anchor[1]],
+        [0, 0, 1]
+    ])
+
+    anchor_i = np.array([
+        [1, 0, -transform.anchor[0]],
+        [0, 1, -transform.anchor[1]],
+        [0, 0, 1]
+    ])
+
+    rotation = np.array([
+        [math.cos(transform.angle), math.sin(transform.angle), 0],
+        [-math.sin(transform.angle), math.cos(transform.angle), 0],
+        [0, 0, 1]
+    ])
+
+    scale = np.array([
+        [transform.scale[0], 0, 0],
+        [0, transform.scale[1], 0],
+        [0, 0, 1]
+    ])
+
+    return np.dot(translation, np.dot(anchor_matrix, np.dot(scale, np.dot(rotation, anchor_i))))
+
+
+def numpy_solve(pos, matrix):
+    matrix = matrix * (*pos, 1)
+    matrix = matrix.sum(1)
+    return tuple(matrix[:2])
+
+
+def affine_matrix(transform):
+    transform._m = None
+    return transform.matrix()
+
+
+parent = Transform(scale=(2, 2), position=(30, 40), angle=0.5, anchor=(5, 5))
+child = Transform(scale=(1.5, 0.5), position=(10, -4), angle=1.2, anchor=(8, 2))
+
+numpy_parent = numpy_matrix(parent)
+numpy_child = numpy_matrix(child)
+affine_parent = parent.matrix()
+affine_child = child.matrix()
+
+cases = (
+    ("build", lambda: numpy_matrix(child), lambda: affine_matrix(child)),
+    ("compose", lambda: np.dot(numpy_parent, numpy_child), lambda: affine_parent @ affine_child),
+    ("solve", lambda: numpy_solve((3, 4), numpy_child), lambda: affine_child.solve((3, 4))),
+)
+
+for name, numpy_case, affine_case in cases:
+    numpy_time = min(timeit.repeat(numpy_case, number=10000, repeat=5)) / 10000
+    affine_time = min(timeit.repeat(affine_case, number=10000, repeat=5)) / 10000
+
+    print(f"{name:>8}: numpy {numpy_time * 1e6:7.3f}us, affine {affine_time * 1e6:7.3f}us, "
+          f"{numpy_time / affine_time:5.1f}x")
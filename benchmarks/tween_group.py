@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import time
+
+from render.scene import Scene
+
+from common import render_all_frames
+
+# compares animating many values with one TweenComponent each
+# against a single TweenGroupComponent holding all of them
+
+
+def make_scene(count, grouped):
+    class BenchmarkScene(Scene):
+        def lifecycle(self, t):
+            self.width = 16
+            self.height = 16
+
+            values = [0] * count
+
+            if grouped:
+                def u(array):
+                    values[:] = array.tolist()
+
+                group = self.create_tween_group(u)
+
+                for index in range(count):
+                    group.add("easeInOutQuad", duration=5, begin_value=0, end_value=index)
+
+            else:
+                for index in range(count):
+                    self.create_tween("easeInOutQuad", lambda value, index=index: values.__setitem__(index, value),
+                                      duration=5, begin_value=0, end_value=index)
+
+            return 0
+
+    return BenchmarkScene()
+
+
+for count in (10, 100, 1000):
+    for grouped in (False, True):
+        scene = make_scene(count, grouped)
+        start = time.perf_counter()
+        frames = render_all_frames(scene)
+        total = time.perf_counter() - start
+
+        print(f"{count:>5} tweens {'grouped' if grouped else 'separate':>8}: {frames} frames, {total:.3f}s total")
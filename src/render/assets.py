@@ -0,0 +1,147 @@
+"""Fonts and images shared by every scene of the process.
+
+Shared assets are read-only: they are returned to every caller as the same object, so they must not be modified or
+closed. Components don't close the shared images they are given."""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import threading
+import typing
+import weakref
+
+from PIL import Image, ImageFont
+
+from .cache import LRUCache
+from .drawer import _image_bytes
+
+# the static images shared by any cache, images are unhashable so they are kept by id
+_shared_images: typing.MutableMapping[int, Image.Image] = weakref.WeakValueDictionary()
+_shared_images_lock = threading.Lock()
+
+
+class AssetCache:
+    """Caches loaded fonts and decoded images, evicting the least recently used ones above ``max_bytes``.
+
+    Fonts are keyed by path and size, images by path and modification time or by the hash of their content.
+    Static images are decoded once and shared, animated images keep their encoded data in memory and
+    every request gets its own handle, so components can seek through their frames independently."""
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self._cache = LRUCache(max_bytes)
+        self._lock = threading.Lock()
+        # images are unhashable, so shared images are kept by id
+        self._shared: typing.MutableMapping[int, Image.Image] = weakref.WeakValueDictionary()
+
+    @property
+    def max_bytes(self):
+        return self._cache.max_size
+
+    @max_bytes.setter
+    def max_bytes(self, value):
+        with self._lock:
+            self._cache.max_size = value
+
+    def _get(self, key):
+        with self._lock:
+            return self._cache.get(key)
+
+    def _put(self, key, value, size):
+        with self._lock:
+            self._cache.put(key, value, size)
+
+    def load_font(self, path, size=10, **kwargs) -> ImageFont.FreeTypeFont:
+        """Same as :func:`PIL.ImageFont.truetype`, but loading each font once"""
+        path = os.path.abspath(path)
+        key = ("font", path, size, tuple(sorted(kwargs.items())))
+
+        font = self._get(key)
+
+        if font is None:
+            font = ImageFont.truetype(path, size, **kwargs)
+            self._put(key, font, os.path.getsize(path))
+
+        return font
+
+    def load_image(self, source: typing.Union[str, os.PathLike, bytes], mode=None) -> Image.Image:
+        """Opens an image from a path or from its encoded content
+
+        :param mode: If set, static images are converted to this mode once before being shared
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data = bytes(source)
+            key = ("image", hashlib.sha1(data).hexdigest(), mode)
+
+        else:
+            data = None
+            path = os.path.abspath(source)
+            stat = os.stat(path)
+            key = ("image", path, stat.st_mtime_ns, stat.st_size, mode)
+
+        entry = self._get(key)
+
+        if entry is None:
+            if data is None:
+                with open(path, "rb") as file:
+                    data = file.read()
+
+            image = Image.open(io.BytesIO(data))
+
+            if getattr(image, "is_animated", False):
+                entry = data
+                size = len(data)
+
+            else:
+                image.load()
+
+                if mode is not None and image.mode != mode:
+                    image = image.convert(mode)
+
+                entry = image
+                size = _image_bytes(image.mode, image.width, image.height)
+
+                with self._lock:
+                    self._shared[id(image)] = image
+
+                with _shared_images_lock:
+                    _shared_images[id(image)] = image
+
+            self._put(key, entry, size)
+
+            if isinstance(entry, Image.Image):
+                return entry
+
+            return image
+
+        if isinstance(entry, Image.Image):
+            return entry
+
+        return Image.open(io.BytesIO(entry))
+
+    def is_shared(self, image: Image.Image) -> bool:
+        """Returns if ``image`` is shared by this cache, in which case it must not be modified or closed"""
+        with self._lock:
+            return self._shared.get(id(image)) is image
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+default_cache = AssetCache()
+
+
+def load_font(path, size=10, **kwargs) -> ImageFont.FreeTypeFont:
+    return default_cache.load_font(path, size, **kwargs)
+
+
+def load_image(source: typing.Union[str, os.PathLike, bytes], mode=None) -> Image.Image:
+    return default_cache.load_image(source, mode)
+
+
+def is_shared(image: Image.Image) -> bool:
+    """Returns if ``image`` is shared by any cache, in which case it must not be modified or closed"""
+    with _shared_images_lock:
+        return _shared_images.get(id(image)) is image
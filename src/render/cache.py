@@ -0,0 +1,84 @@
+import collections
+import threading
+import typing
+
+
+class LRUCache:
+    """Least recently used cache bounded by the total size of its values, sizes are given by the caller.
+    It can be used from several threads at once"""
+
+    def __init__(self, max_size: int):
+        self._lock = threading.RLock()
+        self._max_size = max_size
+
+        self._values: typing.OrderedDict[typing.Hashable, typing.Tuple[typing.Any, int]] = collections.OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value):
+        with self._lock:
+            self._max_size = value
+            self._evict()
+
+    def _evict(self):
+        while self._size > self._max_size:
+            _, (_, evicted_size) = self._values.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._values[key]
+
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._values.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size: int):
+        """Stores a value, evicting the least recently used values until it fits.
+        Values larger than the whole cache are not stored."""
+        with self._lock:
+            self.discard(key)
+
+            if size > self._max_size:
+                return
+
+            self._values[key] = (value, size)
+            self._size += size
+
+            self._evict()
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._values.pop(key, None)
+
+            if entry is not None:
+                self._size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._size = 0
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __len__(self):
+        return len(self._values)
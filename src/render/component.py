@@ -3,15 +3,18 @@ from __future__ import annotations
 import abc
 import functools
 import inspect
+import math
 import typing
 
+import numpy
 from PIL import Image
 
 from .deferrer import DeferredSetter
-from .drawer import ImageDrawCombination
+from .drawer import ImageDrawCombination, ImagePool, composite_at
 from .transform import Transform, transform_in_transform
 
 if typing.TYPE_CHECKING:
+    from .drawlist import DrawList
     from .scene import Scene
 
 
@@ -43,28 +46,198 @@ def normalize_box(box):
 
 
 def get_box_from_transform(transform, raw_points):
-    box = None
+    xs = []
+    ys = []
 
     for point in raw_points:
-        transformed = transform.solve(point)
+        x, y = transform.solve(point)
+        xs.append(x)
+        ys.append(y)
 
-        if box is None:
-            box = [transformed[0], transformed[1], transformed[0], transformed[1]]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def get_boxes_from_matrices(matrices, boxes) -> numpy.ndarray:
+    """Transforms many boxes at once.
+
+    :param matrices: An (N, 6) array of the affine matrices of the transforms
+    :param boxes: An (N, 4) array of the boxes to transform
+    :return: An (N, 4) array of the boxes containing the transformed boxes
+    """
+    matrices = numpy.asarray(matrices, dtype=float)
+    boxes = numpy.asarray(boxes, dtype=float)
+
+    # the corners of every box, in the same order as single boxes
+    xs = boxes[:, (0, 0, 2, 2)]
+    ys = boxes[:, (1, 3, 3, 1)]
+
+    transformed_xs = matrices[:, 0:1] * xs + matrices[:, 1:2] * ys + matrices[:, 2:3]
+    transformed_ys = matrices[:, 3:4] * xs + matrices[:, 4:5] * ys + matrices[:, 5:6]
+
+    return numpy.stack((transformed_xs.min(1), transformed_ys.min(1),
+                        transformed_xs.max(1), transformed_ys.max(1)), 1)
+
+
+def get_world_boxes(components: typing.Sequence[DrawableComponent], transform: Transform) \
+        -> typing.List[typing.Optional[typing.Tuple[float, float, float, float]]]:
+    """Same as calling :meth:`DrawableComponent.get_world_box` on every component.
+    The boxes of components with a local box are computed in a single vectorized call"""
+    boxes = [None] * len(components)
+
+    indices = []
+    matrices = []
+    local_boxes = []
+
+    for index, component in enumerate(components):
+        local_box = component.get_local_box()
+
+        if local_box is None:
+            boxes[index] = component.get_world_box(transform)
 
         else:
-            if transformed[0] < box[0]:
-                box[0] = transformed[0]
+            indices.append(index)
+            matrices.append(tuple(component.get_world_transform(transform).matrix()))
+            local_boxes.append(local_box)
+
+    if indices:
+        for index, box in zip(indices, get_boxes_from_matrices(matrices, local_boxes).tolist()):
+            boxes[index] = tuple(box)
+
+    return boxes
+
+
+def union_box(box1, box2):
+    return min(box1[0], box2[0]), min(box1[1], box2[1]), max(box1[2], box2[2]), max(box1[3], box2[3])
+
+
+def boxes_intersect(box1, box2):
+    return box1[0] < box2[2] and box2[0] < box1[2] and box1[1] < box2[3] and box2[1] < box1[3]
+
+
+def merge_boxes(boxes):
+    """Unions overlapping boxes until none of the remaining boxes overlap"""
+    merged = []
+
+    for box in boxes:
+        while True:
+            for index, other in enumerate(merged):
+                if boxes_intersect(box, other):
+                    box = union_box(box, merged.pop(index))
+                    break
+
+            else:
+                break
+
+        merged.append(box)
+
+    return merged
+
+
+def get_pixel_box(box):
+    if box is None:
+        return None
+
+    # boxes are padded to account for antialiasing and rounding of the drawing operations
+    return math.floor(box[0]) - 1, math.floor(box[1]) - 1, math.ceil(box[2]) + 1, math.ceil(box[3]) + 1
+
+
+def draw_transformed(pool: ImagePool, target: ImageDrawCombination, source: Image.Image, transform: Transform,
+                     resample, size=None):
+    """Resamples ``source`` through ``transform`` and composites it onto ``target``.
+    Only the bounding box of the transformed source is resampled, instead of the whole target.
+
+    The box is clipped to the bounds of the target instead of the target itself, so an image holding a region
+    of a frame gets the same pixels as the frame. Pillow samples relatively to the corner of the box,
+    any other box could round differently
+
+    :param size: The size of the region of ``source`` that has content, defaults to the whole image
+    """
+    width, height = source.size if size is None else size
+
+    box = get_box_from_transform(transform, (
+        (0, 0),
+        (0, height),
+        (width, height),
+        (width, 0)
+    ))
+
+    origin_x, origin_y = target.origin
+    bounds = get_target_bounds(target) if target.bounds is None else target.bounds
+
+    left = max(math.floor(box[0]), bounds[0])
+    top = max(math.floor(box[1]), bounds[1])
+    right = min(math.ceil(box[2]), bounds[2])
+    bottom = min(math.ceil(box[3]), bounds[3])
+
+    if left >= right or top >= bottom or not boxes_intersect((left, top, right, bottom), get_target_bounds(target)):
+        return
+
+    # move the origin of the reverse matrix to the top left corner of the box
+    a, b, c, d, e, f = transform
+    data = (a, b, c + a * left + b * top, d, e, f + d * left + e * top)
+
+    def resample_layer(layer: ImageDrawCombination):
+        # the whole box is overwritten, pixels outside of the source included
+        layer.image.im.transform2((0, 0, right - left, bottom - top), source.im, Image.AFFINE, data, resample, 1)
+        layer.mark_dirty((0, 0, right - left, bottom - top))
+
+    if target.resample_cache is not None:
+        layer = target.resample_cache.get((id(source), data, resample, left, top, right, bottom), source,
+                                          right - left, bottom - top, resample_layer)
+        composite_at(target.image, layer.image, left - origin_x, top - origin_y, (right - left, bottom - top))
+        return
+
+    with pool.request_image(right - left, bottom - top, clear=False, exact_dimensions=False,
+                            track_writes=True) as layer:
+        resample_layer(layer)
+        composite_at(target.image, layer.image, left - origin_x, top - origin_y, (right - left, bottom - top))
+
+
+def get_target_bounds(target: ImageDrawCombination) -> typing.Tuple[int, int, int, int]:
+    """Returns the box covered by ``target`` in the coordinates of its frame"""
+    origin_x, origin_y = target.origin
+    return origin_x, origin_y, origin_x + target.image.width, origin_y + target.image.height
 
-            if transformed[1] < box[1]:
-                box[1] = transformed[1]
 
-            if transformed[0] > box[2]:
-                box[2] = transformed[0]
+def _is_visible(component: DrawableComponent, transform: Transform, pixel_box, box):
+    if pixel_box is not None and not boxes_intersect(pixel_box, box):
+        return False
 
-            if transformed[1] > box[3]:
-                box[3] = transformed[1]
+    if component.mask is not None:
+        mask_transform = component.get_world_transform(transform) if component.local_mask else transform
+        mask_box = get_pixel_box(component.mask.get_world_box(mask_transform))
 
-    return tuple(box)
+        if mask_box is not None:
+            # only the part covered by both the component and its mask is drawn
+            if not boxes_intersect(mask_box, box):
+                return False
+
+            if pixel_box is not None and not boxes_intersect(mask_box, pixel_box):
+                return False
+
+    return True
+
+
+def get_visible_components(components: typing.Sequence[DrawableComponent], transform: Transform, box) \
+        -> typing.List[DrawableComponent]:
+    """Returns the components that can draw inside ``box`` when drawn inside ``transform``, in the same order.
+    Components whose box can't be known are always kept"""
+    return [component for component, world_box in zip(components, get_world_boxes(components, transform))
+            if _is_visible(component, transform, get_pixel_box(world_box), box)]
+
+
+def mark_drawn_boxes(target: ImageDrawCombination, boxes):
+    """Reports the world boxes of the components drawn on ``target`` as its dirty region,
+    for images requested with ``track_writes``. A None box marks the whole image"""
+    origin_x, origin_y = target.origin
+
+    for box in boxes:
+        if box is None:
+            target.mark_all_dirty()
+            return
+
+        # pillow rounds polygon edges, so they can land a pixel outside of the box
+        target.mark_dirty((box[0] - origin_x - 1, box[1] - origin_y - 1, box[2] - origin_x + 1, box[3] - origin_y + 1))
 
 
 class Component:
@@ -95,6 +268,13 @@ class Component:
     def get_next_update(self, t) -> typing.Optional[typing.Tuple[typing.Optional[float], typing.Callable, bool]]:
         pass
 
+    def reschedule(self):
+        """Has to be called when the result of :meth:`get_next_update` changes outside of this component's own updates"""
+        scheduler = getattr(self.scene, "scheduler", None)
+
+        if scheduler is not None:
+            scheduler.invalidate(self)
+
     def cleanup(self):
         pass
 
@@ -177,51 +357,145 @@ class DrawableComponent(Component, abc.ABC):
         self.local_mask = True
         self.mask_transform_resample = Image.BICUBIC
         self.transform = Transform()
-        self.z = 0
 
-    def draw(self, target: ImageDrawCombination, transform: Transform):
+        self._draw_lists: typing.List[DrawList] = []
+        self._z = 0
+
+        # (key, transform), kept in a single attribute so threads drawing concurrently never see a mismatched pair
+        self._world_transform: typing.Optional[tuple] = None
+
+    @property
+    def z(self):
+        return self._z
+
+    @z.setter
+    def z(self, value):
+        self._z = value
+
+        for draw_list in self._draw_lists:
+            draw_list.reposition(self)
+
+    def get_world_transform(self, transform: Transform) -> Transform:
+        """Returns the transform of this component inside ``transform``.
+        It's cached until either transform changes, so the cached transforms of the children of a container
+        are kept as long as the transforms of the container and its parents stay the same"""
+        if transform.is_identity():
+            return self.transform
+
+        key = (transform, transform.version, self.transform, self.transform.version)
+        cached = self._world_transform
+
+        if cached is None or cached[0] != key:
+            cached = self._world_transform = (key, transform_in_transform(transform, self.transform))
+
+        return cached[1]
+
+    def prepare_draw(self, transform: Transform):
+        """Loads what drawing inside ``transform`` needs ahead of time, so the component can then be drawn
+        from several threads at once without each of them loading it"""
         if self.mask is not None:
-            self_new_transform = transform_in_transform(transform, self.transform)
+            self.mask.prepare_draw(self.get_world_transform(transform) if self.local_mask else transform)
 
-            with self.scene.image_pool.request_image(target.image.width, target.image.height,
-                                                     exact_dimensions=False) as self_image:
-                self._draw(self_image, self_new_transform)
+    def draw(self, target: ImageDrawCombination, transform: Transform):
+        if self.mask is not None:
+            if self.local_mask:
+                mask_transform = self.get_world_transform(transform)
+            else:
+                mask_transform = transform
 
-                # self_image.image.show()
-                # we calculate the mask transform
+            # only the part of the target covered by both this component and its mask can be visible
+            region = get_target_bounds(target)
 
-                if self.local_mask:
-                    mask_new_transform = transform_in_transform(transform, self.transform)
-                else:
-                    mask_new_transform = transform
+            for box in (self.get_world_box(transform), self.mask.get_world_box(mask_transform)):
+                box = get_pixel_box(box)
 
-                with self.scene.image_pool.request_image(self_image.image.width, self_image.image.height) as mask_image:
+                if box is not None:
+                    region = (max(region[0], box[0]), max(region[1], box[1]),
+                              min(region[2], box[2]), min(region[3], box[3]))
 
-                    self.mask.draw(mask_image, mask_new_transform)
+            left, top, right, bottom = region
 
-                    with self.scene.image_pool.request_image(self_image.image.width, self_image.image.height,
-                                                             exact_dimensions=False) as intermediate:
+            if left >= right or top >= bottom:
+                return
 
-                        # masks do not blend with the target image, has to create another intermediate image
+            with self.scene.image_pool.request_image(right - left, bottom - top) as self_image, \
+                    self.scene.image_pool.request_image(right - left, bottom - top) as mask_image:
+                # both are drawn on images holding the region of the frame of the target
+                for image in (self_image, mask_image):
+                    image.origin = (left, top)
+                    image.bounds = get_target_bounds(target) if target.bounds is None else target.bounds
+                    image.resample_cache = target.resample_cache
 
-                        if self.mask_channel != "A":
-                            image = mask_image.image.getchannel(self.mask_channel)
+                self._draw(self_image, self.get_world_transform(transform))
+                self.mask.draw(mask_image, mask_transform)
 
-                            intermediate.image.paste(self_image.image,
-                                                     (0, 0),
-                                                     mask=image)
-                        else:
+                # masks do not blend with the target image, the alpha of the drawn component is multiplied instead
+                alpha = numpy.asarray(self_image.image.getchannel("A"), dtype=numpy.uint16)
+                mask = numpy.asarray(mask_image.image.getchannel(self.mask_channel), dtype=numpy.uint16)
 
-                            intermediate.image.paste(self_image.image,
-                                                     (0, 0),
-                                                     mask=mask_image.image)
+                alpha = (alpha * mask + 127) // 255
+                self_image.image.putalpha(Image.fromarray(alpha.astype(numpy.uint8), "L"))
 
-                        target.image.alpha_composite(intermediate.image,
-                                                     (0, 0))
+                target.image.alpha_composite(self_image.image, (left - target.origin[0], top - target.origin[1]))
 
         else:
-            self._draw(target, transform_in_transform(transform, self.transform))
+            self._draw(target, self.get_world_transform(transform))
 
     @abc.abstractmethod
     def _draw(self, target: ImageDrawCombination, transform: Transform):
         pass
+
+    def get_local_box(self) -> typing.Optional[typing.Tuple[float, float, float, float]]:
+        """Returns the box covered by this component before being transformed, None if it isn't a single box"""
+        return None
+
+    def get_active_box(self, transform: typing.Optional[Transform] = None) \
+            -> typing.Optional[typing.Tuple[float, float, float, float]]:
+        """Returns the box covered by this component when drawn with ``transform``, which defaults to its own
+        transform. None if the box cannot be known"""
+        local_box = self.get_local_box()
+
+        if local_box is None:
+            return None
+
+        left, top, right, bottom = local_box
+
+        return get_box_from_transform(self.transform if transform is None else transform, (
+            (left, top),
+            (left, bottom),
+            (right, bottom),
+            (right, top)
+        ))
+
+    def get_world_box(self, transform: Transform) -> typing.Optional[typing.Tuple[float, float, float, float]]:
+        """Returns the box covered by this component when drawn inside ``transform``"""
+        return self.get_active_box(self.get_world_transform(transform))
+
+    def get_render_state(self) -> typing.Optional[typing.Hashable]:
+        """Returns a value that changes whenever this component would draw differently with the same transform.
+        None if it cannot be known, in which case the component is assumed to change on every frame"""
+        return None
+
+    def get_draw_state(self, transform: Transform) -> typing.Optional[typing.Hashable]:
+        """Returns a value that changes whenever this component would draw differently inside ``transform``,
+        None if it cannot be known"""
+        state = self.get_render_state()
+
+        if state is None:
+            return None
+
+        new_transform = self.get_world_transform(transform)
+
+        if self.mask is not None:
+            mask_state = self.mask.get_draw_state(new_transform if self.local_mask else transform)
+
+            if mask_state is None:
+                return None
+
+            mask_state = mask_state, self.mask_channel, self.mask_transform_resample
+
+        else:
+            mask_state = None
+
+        return (new_transform.scale, new_transform.position, new_transform.angle, new_transform.anchor,
+                self.z, mask_state, state)
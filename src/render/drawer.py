@@ -1,7 +1,11 @@
+from __future__ import annotations
+
+import bisect
+import collections
 import contextlib
 import dataclasses
-import gc
 import math
+import threading
 import time
 
 import typing
@@ -9,16 +13,55 @@ from PIL import Image
 from PIL.ImageDraw import ImageDraw
 
 
+def _mark_dirty(comb, box):
+    box = (max(math.floor(box[0]), 0), max(math.floor(box[1]), 0),
+           min(math.ceil(box[2]), comb.image.width), min(math.ceil(box[3]), comb.image.height))
+
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return
+
+    if comb.dirty_box is None:
+        comb.dirty_box = box
+
+    else:
+        comb.dirty_box = (min(comb.dirty_box[0], box[0]), min(comb.dirty_box[1], box[1]),
+                          max(comb.dirty_box[2], box[2]), max(comb.dirty_box[3], box[3]))
+
+
 if typing.TYPE_CHECKING:
     class ImageDrawCombination(Image.Image, ImageDraw):
         image: Image.Image
         draw: ImageDraw
+        dirty_box: typing.Optional[typing.Tuple[int, int, int, int]]
+        origin: typing.Tuple[int, int]
+        bounds: typing.Optional[typing.Tuple[int, int, int, int]]
+        resample_cache: typing.Optional[ResampleCache]
+
+        def mark_dirty(self, box): ...
+
+        def mark_all_dirty(self): ...
 
 else:
     @dataclasses.dataclass
     class ImageDrawCombination:
         image: Image.Image
         draw: ImageDraw
+        # the region that may have been drawn on since the image was last cleared
+        dirty_box: typing.Optional[typing.Tuple[int, int, int, int]] = None
+        # the position of the top left corner of the image in the frame it's part of,
+        # what is drawn on it is placed in the coordinates of that frame
+        origin: typing.Tuple[int, int] = (0, 0)
+        # the part of the frame resampled drawings are clipped to, the image itself if None.
+        # images holding a region of a frame set it to the whole frame, so they resample the same pixels as the frame
+        bounds: typing.Optional[typing.Tuple[int, int, int, int]] = None
+        # resampled drawings shared by the images holding the regions of the same frame
+        resample_cache: typing.Optional[ResampleCache] = None
+
+        def mark_dirty(self, box):
+            _mark_dirty(self, box)
+
+        def mark_all_dirty(self):
+            self.dirty_box = (0, 0, self.image.width, self.image.height)
 
         def __getattr__(self, item):
             if hasattr(self.image, item):
@@ -28,97 +71,321 @@ else:
                 getattr(self.draw, item)
 
 
-def create_image(width, height):
-    print(f"creating {width=} {height=} image")
-    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+def create_image(width, height, mode="RGBA"):
+    image = Image.new(mode, (width, height))
     drawer = ImageDraw(image)
     return ImageDrawCombination(image, drawer)
 
 
+def _image_bytes(mode, width, height):
+    # pillow stores multi band images with 4 bytes per pixel
+    return width * height * (1 if Image.getmodebands(mode) == 1 else 4)
+
+
+def composite_at(target: Image.Image, source: Image.Image, x: int, y: int, size=None):
+    """Alpha composites ``source`` with its top left corner at (x, y) of ``target``, clipped to ``target``
+
+    :param size: The size of the region of ``source`` to composite, starting at its top left corner.
+    Defaults to the whole image
+    """
+    width, height = source.size if size is None else size
+
+    left = max(x, 0)
+    top = max(y, 0)
+    right = min(x + width, target.width)
+    bottom = min(y + height, target.height)
+
+    if left >= right or top >= bottom:
+        return
+
+    target.alpha_composite(source, (left, top), (left - x, top - y, right - x, bottom - y))
+
+
 class ImagePool:
-    def __init__(self):
-        self._images: typing.List[typing.Optional[ImageDrawCombination]] = []
-        self._locked: typing.List[int] = []
-        self._active = 0
+    """Reuses images between drawing operations.
+
+    Unused images are kept in free lists bucketed by (mode, width, height), with a per-mode index of the bucket
+    sizes sorted by area for requests that accept larger images. The least recently released images are closed
+    once the pooled images take more than ``max_bytes``.
+
+    The pool can be used from several threads at once, an image is only ever handed out to one request at a time."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+
+        self._lock = threading.RLock()
+
+        self._images: typing.Dict[int, ImageDrawCombination] = {}
+        # bucket -> unused images, dicts are used as ordered sets keyed by id
+        self._free: typing.Dict[typing.Tuple[str, int, int], typing.Dict[int, ImageDrawCombination]] = {}
+        # mode -> sorted (area, width, height) of the buckets that have unused images
+        self._free_sizes: typing.Dict[str, typing.List[typing.Tuple[int, int, int]]] = {}
+        # unused images from the least to the most recently released
+        self._lru: typing.OrderedDict[int, ImageDrawCombination] = collections.OrderedDict()
+
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
         self.lookup_time = 0
 
     @contextlib.contextmanager
-    def request_image(self, width, height, mode="RGBA", *, clear=True, exact_dimensions=True):
+    def request_image(self, width, height, mode="RGBA", *, clear=True, exact_dimensions=True, track_writes=False):
         """
         :param width: The width of the pooled image
         :param height: The height of the pooled image
         :param mode: The mode of the image
-        :param clear: Set if the image should be cleared before returning
+        :param clear: Set if the image should be cleared before returning.
+        Only the region drawn on by its previous users is cleared.
+        Can be unset when the caller overwrites everything it reads from the image
         :param exact_dimensions: Set if the expected image should match the requested dimensions.
         if False the returned image can be larger than the requested dimensions,
         depending on the currently pooled images
+        :param track_writes: Set if the caller reports every region it draws on with ``mark_dirty``,
+        otherwise the whole image is assumed to be drawn on
         """
         start = time.perf_counter()
 
-        index = 0
-
         width = math.ceil(width)
         height = math.ceil(height)
 
-        while (index < len(self._images) and
-               (index in self._locked or self._images[index] is None or self._images[index].mode != mode or
-                (self._images[index].image.size != (width, height) if exact_dimensions else
-                 (self._images[index].image.width < width or self._images[index].image.height < height))
-                )):
+        with self._lock:
+            im = self._take_free(mode, width, height, exact_dimensions)
 
-            index += 1
+            if im is None:
+                self.misses += 1
+                im = self.pool_image(width, height, mode)
 
-        if index >= len(self._images):
-            clear = False  # newly created image
+            else:
+                self.hits += 1
 
-        while index >= len(self._images):
-            self.pool_image(width, height)
+            self._evict()
 
-        im = self._images[index]
-        self._locked.append(index)
+            self.lookup_time += time.perf_counter() - start
 
-        if clear:
-            im.draw.rectangle((0, 0, im.image.width, im.image.height), (0, 0, 0, 0))
+        # the image belongs to this request only, it doesn't need the lock anymore
+        if clear and im.dirty_box is not None:
+            left, top, right, bottom = im.dirty_box
+            im.draw.rectangle((left, top, right - 1, bottom - 1), 0)
+            im.dirty_box = None
 
-        try:
-            if self._active > 200:
-                self.cleanup_dead_images()
+        if not track_writes:
+            im.mark_all_dirty()
 
-            self.lookup_time += time.perf_counter() - start
+        im.origin = (0, 0)
+        im.bounds = None
+        im.resample_cache = None
 
-            yield self._images[index]
+        try:
+            yield im
 
         finally:
-            self._locked.remove(index)
+            with self._lock:
+                if id(im) in self._images:
+                    self._put_free(im)
+                    self._evict()
+
+    def _take_free(self, mode, width, height, exact_dimensions) -> typing.Optional[ImageDrawCombination]:
+        key = (mode, width, height)
+
+        if key not in self._free and not exact_dimensions:
+            # best fit, the smallest image by area that contains the requested dimensions
+            sizes = self._free_sizes.get(mode, ())
+
+            for index in range(bisect.bisect_left(sizes, (width * height, 0, 0)), len(sizes)):
+                _, candidate_width, candidate_height = sizes[index]
+
+                if candidate_width >= width and candidate_height >= height:
+                    key = (mode, candidate_width, candidate_height)
+                    break
+
+        bucket = self._free.get(key)
+
+        if bucket is None:
+            return None
+
+        _, im = bucket.popitem()
+        del self._lru[id(im)]
+
+        if not bucket:
+            self._remove_bucket(key)
+
+        return im
+
+    def _put_free(self, im: ImageDrawCombination):
+        key = (im.image.mode, im.image.width, im.image.height)
+        bucket = self._free.get(key)
+
+        if bucket is None:
+            bucket = self._free[key] = {}
+            bisect.insort(self._free_sizes.setdefault(key[0], []), (key[1] * key[2], key[1], key[2]))
+
+        bucket[id(im)] = im
+        self._lru[id(im)] = im
+
+    def _remove_bucket(self, key):
+        del self._free[key]
+
+        sizes = self._free_sizes[key[0]]
+        del sizes[bisect.bisect_left(sizes, (key[1] * key[2], key[1], key[2]))]
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._lru:
+            _, im = self._lru.popitem(last=False)
+
+            key = (im.image.mode, im.image.width, im.image.height)
+            bucket = self._free[key]
+            del bucket[id(im)]
+
+            if not bucket:
+                self._remove_bucket(key)
+
+            self._discard(im)
+            self.evictions += 1
+
+    def _discard(self, im: ImageDrawCombination):
+        del self._images[id(im)]
+        self.bytes -= _image_bytes(im.image.mode, im.image.width, im.image.height)
+        im.image.close()
 
     def close(self):
-        for image in self._images:
-            if image is not None:
+        with self._lock:
+            for image in self._images.values():
                 image.image.close()
 
-    def cleanup_dead_images(self):
-        goal = 100
+            self._images.clear()
+            self._free.clear()
+            self._free_sizes.clear()
+            self._lru.clear()
+            self.bytes = 0
 
-        for idx, image in enumerate(self._images):
-            if self._active < goal:
-                break
-
-            if idx not in self._locked and image is not None:
-                width, height = self._images[idx].image.size
-                print(f"cleaning {width=} {height=} image")
-                self._images[idx] = None
-                self._active -= 1
+    def cleanup_dead_images(self):
+        """Closes every image that is not currently in use"""
+        with self._lock:
+            for im in self._lru.values():
+                self._discard(im)
 
-        gc.collect()
+            self._free.clear()
+            self._free_sizes.clear()
+            self._lru.clear()
 
     def remove_dead_indexes(self):
-        print(f"removing dead indexes")
+        """Same as :meth:`cleanup_dead_images`, kept from when pooled images were stored in a list"""
+        self.cleanup_dead_images()
+
+    def pool_image(self, width, height, mode="RGBA") -> ImageDrawCombination:
+        im = create_image(width, height, mode)
 
-        self._images = [image for image in self._images if image is not None]
+        with self._lock:
+            self._images[id(im)] = im
+            self.bytes += _image_bytes(mode, width, height)
 
-    def pool_image(self, width, height):
-        self._images.append(create_image(width, height))
-        self._active += 1
+        return im
 
     def __len__(self):
         return len(self._images)
+
+
+class ImagePoolLease:
+    """A scene's handle on a pool shared with other scenes.
+    Requests go to the shared pool, closing the lease gives its images back without closing them,
+    so they can be reused by the next scene"""
+
+    def __init__(self, pool: ImagePool):
+        self.pool = pool
+
+        self.images_in_use = 0
+        self.bytes_in_use = 0
+
+    @contextlib.contextmanager
+    def request_image(self, width, height, mode="RGBA", **kwargs):
+        """Same as :meth:`ImagePool.request_image`"""
+        with self.pool.request_image(width, height, mode, **kwargs) as im:
+            size = _image_bytes(im.image.mode, im.image.width, im.image.height)
+
+            with self.pool._lock:
+                self.images_in_use += 1
+                self.bytes_in_use += size
+
+            try:
+                yield im
+
+            finally:
+                with self.pool._lock:
+                    self.images_in_use -= 1
+                    self.bytes_in_use -= size
+
+    def close(self):
+        # the shared pool outlives the scene, its images stay pooled for the next ones
+        pass
+
+    def cleanup_dead_images(self):
+        self.pool.cleanup_dead_images()
+
+    def __len__(self):
+        return self.images_in_use
+
+
+class ResampleCache:
+    """Keeps the resampled drawings of a frame drawn in several regions, so a drawing spanning several of them
+    is only resampled once. Its images are given back to the pool when it's closed.
+    It can be used from several threads at once"""
+
+    def __init__(self, pool: typing.Union[ImagePool, ImagePoolLease]):
+        self.pool = pool
+
+        self._lock = threading.Lock()
+        # key -> [lock of the entry, source, resampled image]
+        self._entries: typing.Dict[typing.Hashable, list] = {}
+        self._leases = contextlib.ExitStack()
+
+    def get(self, key, source: Image.Image, width, height,
+            resample: typing.Callable[[ImageDrawCombination], None]) -> ImageDrawCombination:
+        """Returns the image resampled by ``resample`` for ``key``, calling it on a pooled image of the given size
+        the first time. ``source`` is kept until the cache is closed, so keys can hold its id"""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                entry = self._entries[key] = [threading.Lock(), source, None]
+
+        with entry[0]:
+            if entry[2] is None:
+                with self._lock:
+                    image = self._leases.enter_context(self.pool.request_image(width, height, clear=False,
+                                                                               exact_dimensions=False,
+                                                                               track_writes=True))
+
+                resample(image)
+                entry[2] = image
+
+        return entry[2]
+
+    def close(self):
+        with self._lock:
+            self._leases.close()
+            self._entries.clear()
+
+
+_shared_image_pool: typing.Optional[ImagePool] = None
+_shared_image_pool_lock = threading.Lock()
+
+
+def get_shared_image_pool(max_bytes=None) -> ImagePool:
+    """Returns the pool shared by every scene of the process, creating it on the first call
+
+    :param max_bytes: If set, changes the amount of bytes the shared pool can keep
+    """
+    global _shared_image_pool
+
+    with _shared_image_pool_lock:
+        if _shared_image_pool is None:
+            _shared_image_pool = ImagePool() if max_bytes is None else ImagePool(max_bytes)
+
+        elif max_bytes is not None:
+            with _shared_image_pool._lock:
+                _shared_image_pool.max_bytes = max_bytes
+                _shared_image_pool._evict()
+
+        return _shared_image_pool
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import bisect
+import itertools
+import typing
+
+if typing.TYPE_CHECKING:
+    from .component import DrawableComponent
+
+
+class DrawList:
+    """The drawables of a scene or container, kept sorted by z.
+
+    Objects with the same z keep the order they were added in. Objects are only moved when their z is assigned,
+    so drawing doesn't need to sort them again on every frame."""
+
+    def __init__(self):
+        # (z, order) of every object, in the same order as _objects
+        self._keys: typing.List[typing.Tuple[typing.Any, int]] = []
+        self._objects: typing.List[DrawableComponent] = []
+        self._counter = itertools.count()
+
+    def add(self, obj: DrawableComponent):
+        key = (obj.z, next(self._counter))
+        index = bisect.bisect_right(self._keys, key)
+
+        self._keys.insert(index, key)
+        self._objects.insert(index, obj)
+
+        obj._draw_lists.append(self)
+
+    def remove(self, obj: DrawableComponent):
+        index = self._objects.index(obj)
+
+        del self._keys[index]
+        del self._objects[index]
+
+        obj._draw_lists.remove(self)
+
+    def reposition(self, obj: DrawableComponent):
+        """Moves ``obj`` to match its z, has to be called when it changes"""
+        for index, current in enumerate(self._objects):
+            if current is obj:
+                _, order = self._keys.pop(index)
+                self._objects.pop(index)
+
+                key = (obj.z, order)
+                new_index = bisect.bisect_right(self._keys, key)
+
+                self._keys.insert(new_index, key)
+                self._objects.insert(new_index, obj)
+
+                return
+
+    def __iter__(self):
+        return iter(self._objects)
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __getitem__(self, item):
+        return self._objects[item]
+
+    def __contains__(self, item):
+        return item in self._objects
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._objects!r})"
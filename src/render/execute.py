@@ -1,25 +1,257 @@
 from __future__ import annotations
 
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import math
+import os
+import queue
+import threading
 import typing
 from io import BytesIO
 from typing import TYPE_CHECKING
 
 import imageio
 import numpy
+from PIL import Image
+
+from .scene import run_in_executor
 
 if TYPE_CHECKING:
     from .scene import Scene
 
 
+def _check_callback(result):
+    if not result:
+        raise RuntimeError("Callback stopped execution")
+
+
+class _FrameWriter:
+    """Encodes the frames of a scene, as a static image if it only has one frame.
+    Callbacks are left to the caller, ``write`` and ``finish`` return how many times the progress should be reported"""
+
+    def __init__(self, io, format_if_animated, format_if_static, kwargs_if_animated, kwargs_if_static):
+        self.io = io
+        self.format_if_animated = format_if_animated
+        self.format_if_static = format_if_static
+        self.kwargs_if_animated = kwargs_if_animated
+        self.kwargs_if_static = kwargs_if_static
+
+        self.writer = None
+        self.first_frame = None
+        self.first_duration = None
+
+    def write(self, image: Image.Image, duration, *, owned=False) -> int:
+        """
+        :param owned: Set if the image will not be modified by the scene anymore, so it doesn't need to be copied
+        """
+        if self.first_frame is None:
+            self.first_frame = image if owned else image.copy()
+            self.first_duration = duration
+            return 0
+
+        reports = 1
+
+        if self.writer is None:
+            self.writer = imageio.get_writer(self.io, self.format_if_animated, **self.kwargs_if_animated)
+
+            self.writer._duration = self.first_duration
+            self.writer.append_data(numpy.array(self.first_frame))
+
+            reports += 1
+
+        self.writer._duration = duration
+        self.writer.append_data(numpy.array(image))
+
+        return reports
+
+    def finish(self) -> int:
+        if self.writer is None:
+            self.first_frame.save(self.io, self.format_if_static, **self.kwargs_if_static)
+            return 1
+
+        return 0
+
+    @property
+    def animated(self):
+        return self.writer is not None
+
+
+class _BackgroundEncoder(threading.Thread):
+    """Consumes frames from a bounded queue, so encoding happens while the scene renders the next frames"""
+
+    def __init__(self, writer: _FrameWriter, callback, max_queued_frames):
+        super().__init__(name="render-encoder", daemon=True)
+        self.frame_writer = writer
+        self.callback = callback
+        self.frames = queue.Queue(max_queued_frames)
+        self.error: typing.Optional[BaseException] = None
+
+    def run(self):
+        while True:
+            item = self.frames.get()
+
+            if item is None:
+                break
+
+            if self.error is not None:
+                # keep draining so the scene never blocks on a full queue
+                continue
+
+            image, duration, second = item
+
+            try:
+                for _ in range(self.frame_writer.write(image, duration, owned=True)):
+                    _check_callback(self.callback(self.frame_writer.io, second))
+
+            except BaseException as e:
+                self.error = e
+
+
 def run_scene(scene: Scene, io=None, *,
               format_if_animated="gif",
               format_if_static="png",
               callback: typing.Callable[[typing.IO, float], bool] = lambda *_: True,
               kwargs_if_animated: dict = None,
-              kwargs_if_static: dict = None):
-    first_frame = None
-    first_duration = None
+              kwargs_if_static: dict = None,
+              background_encoding=False,
+              max_queued_frames=8):
+    """
+    :param background_encoding: Set if frames should be encoded in another thread while the scene keeps rendering.
+    The callback is then called from that thread, and its errors are raised from this function
+    :param max_queued_frames: The amount of rendered frames that can wait to be encoded before rendering pauses
+    """
+    if kwargs_if_static is None:
+        kwargs_if_static = {}
+
+    if kwargs_if_animated is None:
+        kwargs_if_animated = {}
+
+    if io is None:
+        io = BytesIO()
+
+    writer = _FrameWriter(io, format_if_animated, format_if_static, kwargs_if_animated, kwargs_if_static)
+
+    if not background_encoding:
+        for image, duration in scene:
+            for _ in range(writer.write(image, duration)):
+                _check_callback(callback(io, scene.current_frame_second))
+
+    else:
+        _encode_in_background(scene, writer, callback, max_queued_frames)
+
+    for _ in range(writer.finish()):
+        _check_callback(callback(io, scene.current_frame_second))
+
+    return io, writer.animated
+
+
+def _encode_in_background(scene: Scene, writer: _FrameWriter, callback, max_queued_frames):
+    encoder = _BackgroundEncoder(writer, callback, max_queued_frames)
+    encoder.start()
+
+    frames = iter(scene)
+
+    try:
+        for image, duration in frames:
+            if encoder.error is not None:
+                break
 
+            # the scene draws the next frame over the same image, so a copy is queued
+            encoder.frames.put((image.copy(), duration, scene.current_frame_second))
+
+    finally:
+        frames.close()
+        encoder.frames.put(None)
+        encoder.join()
+
+    if encoder.error is not None:
+        raise encoder.error
+
+
+async def _continue(*_):
+    return True
+
+
+async def run_scene_async(scene: Scene, io=None, *,
+                          format_if_animated="gif",
+                          format_if_static="png",
+                          callback: typing.Callable[[typing.IO, float], typing.Awaitable[bool]] = _continue,
+                          kwargs_if_animated: dict = None,
+                          kwargs_if_static: dict = None,
+                          executor: concurrent.futures.Executor = None):
+    """Same as :func:`run_scene`, but rendering and encoding run in ``executor`` (the loop's default one if None)
+    so the event loop is free in the meantime. The callback is awaited after each encoded frame.
+    Cancelling stops the render after the frame currently being rendered."""
+    if kwargs_if_static is None:
+        kwargs_if_static = {}
+
+    if kwargs_if_animated is None:
+        kwargs_if_animated = {}
+
+    if io is None:
+        io = BytesIO()
+
+    writer = _FrameWriter(io, format_if_animated, format_if_static, kwargs_if_animated, kwargs_if_static)
+
+    async with contextlib.aclosing(scene.frames_async(executor)) as frames:
+        async for image, duration in frames:
+            for _ in range(await run_in_executor(executor, writer.write, image, duration)):
+                _check_callback(await callback(io, scene.current_frame_second))
+
+    for _ in range(await run_in_executor(executor, writer.finish)):
+        _check_callback(await callback(io, scene.current_frame_second))
+
+    return io, writer.animated
+
+
+def _count_frames(scene_factory: typing.Callable[[], Scene]):
+    scene = scene_factory()
+    scene.rendered_frames = range(0)
+
+    for _ in scene:
+        pass
+
+    return scene.frame_index + 1, scene.coalesce_frames
+
+
+def _render_segment(scene_factory: typing.Callable[[], Scene], frames: range):
+    """Runs a scene from the start, only rendering ``frames``.
+    Frames are returned as raw data, with the duration of each one"""
+    scene = scene_factory()
+    scene.rendered_frames = frames
+
+    rendered = []
+
+    with contextlib.closing(iter(scene)) as iterator:
+        for image, duration in iterator:
+            if scene.frame_index >= frames.stop:
+                break
+
+            if scene.frame_index in frames:
+                rendered.append((image.mode, image.size, image.tobytes(), duration))
+
+    return rendered
+
+
+def run_scene_parallel(scene_factory: typing.Callable[[], Scene], io=None, *,
+                       format_if_animated="gif",
+                       format_if_static="png",
+                       callback: typing.Callable[[typing.IO, float], bool] = lambda *_: True,
+                       kwargs_if_animated: dict = None,
+                       kwargs_if_static: dict = None,
+                       processes=None,
+                       segment_frames=None):
+    """Same as :func:`run_scene`, but the timeline is split in segments of frames rendered by a pool of processes.
+    Each process creates its own scene and runs it from the start without drawing until its segment begins,
+    so the scene has to behave the same on every run.
+
+    :param scene_factory: Creates the scene, it has to be picklable, a scene class defined at module level works
+    :param processes: The amount of processes rendering at once, defaults to the amount of CPUs
+    :param segment_frames: The amount of frames in a segment, defaults to splitting the timeline in 4 segments
+    per process. Larger segments spend less time catching up to their start, smaller ones balance better
+    """
     if kwargs_if_static is None:
         kwargs_if_static = {}
 
@@ -29,33 +261,67 @@ def run_scene(scene: Scene, io=None, *,
     if io is None:
         io = BytesIO()
 
-    writer = None
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # a first run without drawing gives the amount of frames to split
+    frame_count, coalesce_frames = _count_frames(scene_factory)
+
+    if segment_frames is None:
+        segment_frames = max(1, math.ceil(frame_count / (processes * 4)))
+
+    segments = iter(range(start, min(start + segment_frames, frame_count))
+                    for start in range(0, frame_count, segment_frames))
+
+    writer = _FrameWriter(io, format_if_animated, format_if_static, kwargs_if_animated, kwargs_if_static)
+
+    second = 0
+    shown = None
+    shown_duration = 0
+
+    def write(frame, duration):
+        nonlocal second
+        second += duration
+
+        mode, size, data = frame
+
+        for _ in range(writer.write(Image.frombytes(mode, size, data), duration, owned=True)):
+            _check_callback(callback(io, second))
+
+    executor = concurrent.futures.ProcessPoolExecutor(processes)
+
+    try:
+        # a bounded amount of segments are queued, so finished frames don't pile up in memory
+        futures = collections.deque(executor.submit(_render_segment, scene_factory, segment)
+                                    for segment in itertools.islice(segments, processes * 2))
+
+        while futures:
+            frames = futures.popleft().result()
 
-    for image, duration in scene:
-        if first_frame is None:
-            first_frame = image.copy()
-            first_duration = duration
+            segment = next(segments, None)
 
-        else:
-            if writer is None:
-                writer = imageio.get_writer(io, format_if_animated, **kwargs_if_animated)
+            if segment is not None:
+                futures.append(executor.submit(_render_segment, scene_factory, segment))
 
-                writer._duration = first_duration
-                writer.append_data(numpy.array(first_frame))
+            for mode, size, data, duration in frames:
+                if coalesce_frames and shown is not None and shown[2] == data:
+                    # segments are rendered without coalescing, identical frames are merged here instead
+                    shown_duration += duration
+                    continue
 
-                if not callback(io, scene.current_frame_second):
-                    raise RuntimeError("Callback stopped execution")
+                if shown is not None:
+                    write(shown, shown_duration)
 
-            writer._duration = duration
-            writer.append_data(numpy.array(image))
+                shown = (mode, size, data)
+                shown_duration = duration
 
-            if not callback(io, scene.current_frame_second):
-                raise RuntimeError("Callback stopped execution")
+        if shown is not None:
+            write(shown, shown_duration)
 
-    if writer is None:
-        first_frame.save(io, format_if_static, **kwargs_if_static)
+    finally:
+        executor.shutdown(cancel_futures=True)
 
-        if not callback(io, scene.current_frame_second):
-            raise RuntimeError("Callback stopped execution")
+    for _ in range(writer.finish()):
+        _check_callback(callback(io, second))
 
-    return io, writer is not None
+    return io, writer.animated
@@ -1,21 +1,186 @@
+import contextlib
+import math
+import threading
 import typing
 
-from ..component import DrawableComponent
-from ..drawer import ImageDrawCombination
-from ..transform import Transform
+from PIL import Image
+
+from ..component import (DrawableComponent, draw_transformed, get_pixel_box, get_target_bounds, get_visible_components,
+                         get_world_boxes, mark_drawn_boxes, union_box)
+from ..drawer import ImageDrawCombination, composite_at
+from ..drawlist import DrawList
+from ..transform import Transform, transform_in_transform
+
+
+def _is_translation(transform: Transform):
+    return transform.scale == (1, 1) and transform.angle == 0
+
+
+def _get_layer_phase(transform: Transform) -> typing.Tuple[float, float]:
+    """Returns the fraction of a pixel a container drawn in ``transform`` is moved by,
+    scaled or rotated containers resample their layer so they don't need one"""
+    if not _is_translation(transform):
+        return 0, 0
+
+    x = transform.position[0] - transform.anchor[0]
+    y = transform.position[1] - transform.anchor[1]
+    return x - math.floor(x), y - math.floor(y)
 
 
 class ContainerComponent(DrawableComponent):
     def __init__(self, scene):
         super().__init__(scene)
-        self.drawing_objects: typing.List[DrawableComponent] = []
+        self.drawing_objects = DrawList()
+
+        # when enabled, the children are drawn once on a layer that is reused until any of them changes.
+        # translated containers keep drawing the layer as is, it's drawn again whenever their position
+        # moves by a fraction of a pixel. scaled or rotated containers resample it with cache_resample
+        self.cache_as_bitmap = False
+        self.cache_resample = Image.BICUBIC
+
+        self._layer: typing.Optional[ImageDrawCombination] = None
+        self._layer_lease: typing.Optional[contextlib.ExitStack] = None
+        self._layer_state = None
+        self._layer_origin = None
+        self._layer_lock = threading.Lock()
 
     def _draw(self, target: ImageDrawCombination, transform: Transform):
-        for obj in self.drawing_objects:
+        if self.cache_as_bitmap:
+            layer = self._get_layer(_get_layer_phase(transform))
+
+            if layer is not None:
+                self._draw_layer(target, transform, layer)
+                return
+
+        self._draw_children(target, transform)
+
+    def _draw_children(self, target: ImageDrawCombination, transform: Transform):
+        objects = self.drawing_objects
+        culled = 0
+
+        if self.scene.culling:
+            objects = get_visible_components(objects, transform, get_target_bounds(target))
+            culled = len(self.drawing_objects) - len(objects)
+
+        self.scene.count_objects(len(objects), culled)
+
+        for obj in objects:
             obj.draw(target, transform)
 
+    def _get_layer(self, phase) -> typing.Optional[ImageDrawCombination]:
+        """Returns the children drawn without this container's transform, None if they can't be cached
+
+        :param phase: The fraction of a pixel the children are moved by on the layer
+        """
+        with self._layer_lock:
+            return self._update_layer(phase)
+
+    def _update_layer(self, phase) -> typing.Optional[ImageDrawCombination]:
+        state = self.get_render_state()
+
+        if state is None:
+            self.release_layer()
+            return None
+
+        state = (state, phase)
+
+        if self._layer is not None and self._layer_state == state:
+            return self._layer
+
+        self.release_layer()
+
+        box = get_pixel_box(self.get_active_box(Transform(position=phase)))
+
+        if box is None:
+            return None
+
+        left, top, right, bottom = box
+
+        lease = contextlib.ExitStack()
+        layer = lease.enter_context(self.scene.image_pool.request_image(right - left, bottom - top,
+                                                                        track_writes=True))
+
+        layer_transform = Transform(position=(phase[0] - left, phase[1] - top))
+        mark_drawn_boxes(layer, get_world_boxes(self.drawing_objects, layer_transform))
+        self._draw_children(layer, layer_transform)
+
+        self._layer = layer
+        self._layer_lease = lease
+        self._layer_state = state
+        self._layer_origin = (left, top)
+
+        return layer
+
+    def _draw_layer(self, target: ImageDrawCombination, transform: Transform, layer: ImageDrawCombination):
+        left, top = self._layer_origin
+
+        if _is_translation(transform):
+            # the fraction of a pixel is already part of the layer
+            composite_at(target.image, layer.image,
+                         math.floor(transform.position[0] - transform.anchor[0]) + left - target.origin[0],
+                         math.floor(transform.position[1] - transform.anchor[1]) + top - target.origin[1])
+
+        else:
+            layer_transform = transform_in_transform(transform, Transform(position=(left, top)))
+            draw_transformed(self.scene.image_pool, target, layer.image, layer_transform, self.cache_resample)
+
+    def prepare_draw(self, transform: Transform):
+        super().prepare_draw(transform)
+
+        world_transform = self.get_world_transform(transform)
+
+        if self.cache_as_bitmap and self._get_layer(_get_layer_phase(world_transform)) is not None:
+            return
+
+        for obj in self.drawing_objects:
+            obj.prepare_draw(world_transform)
+
+    def release_layer(self):
+        """Gives the cached layer back to the image pool, it is drawn again the next time it's needed"""
+        if self._layer_lease is not None:
+            self._layer_lease.close()
+
+        self._layer = None
+        self._layer_lease = None
+        self._layer_state = None
+        self._layer_origin = None
+
+    def cleanup(self):
+        self.release_layer()
+
     def draw_object(self, obj):
-        self.drawing_objects.append(obj)
+        self.drawing_objects.add(obj)
 
     def remove_draw_object(self, obj):
         self.drawing_objects.remove(obj)
+
+    def get_active_box(self, transform=None):
+        if transform is None:
+            transform = self.transform
+
+        box = None
+
+        for child_box in get_world_boxes(self.drawing_objects, transform):
+            if child_box is None:
+                return None
+
+            box = child_box if box is None else union_box(box, child_box)
+
+        if box is None:
+            # an empty container covers no pixels
+            return (*transform.position, *transform.position)
+
+        return box
+
+    def get_render_state(self):
+        states = []
+
+        for obj in self.drawing_objects:
+            state = obj.get_draw_state(Transform())
+
+            if state is None:
+                return None
+
+            states.append((obj, state))
+
+        return tuple(states), self.cache_as_bitmap, self.cache_resample
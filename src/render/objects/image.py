@@ -1,10 +1,16 @@
+import bisect
+import functools
+import itertools
+import math
+import threading
 import typing
 
 from PIL import Image
 
-from ..drawer import ImageDrawCombination
-from ..component import DrawableComponent, get_box_from_transform
-from ..transform import Transform
+from ..assets import is_shared
+from ..drawer import ImageDrawCombination, composite_at
+from ..component import DrawableComponent, draw_transformed
+from ..transform import Transform, transform_in_transform
 
 
 class ImageComponent(DrawableComponent):
@@ -12,32 +18,67 @@ class ImageComponent(DrawableComponent):
         super().__init__(scene)
 
         self._image: Image.Image = image
+        self._size = image.size  # the size before any reduced decoding
         self.image_resample = Image.BICUBIC
+        self.blit_optimization = True
+        # when drawn scaled down, a copy reduced by a power of two close to the scale is resampled instead
+        self.mipmap_optimization = True
+        # when set, JPEG images are decoded at the smallest resolution still sharp at this scale,
+        # larger scales are resampled from the reduced image
+        self.decode_scale: typing.Optional[float] = None
+
+        self._rgba_image: typing.Optional[Image.Image] = None
+        self._decode_lock = threading.Lock()  # decoding seeks and loads the source, which isn't thread safe
+        self._frame = 0
+        self._frame_ends = None
+        self._frames_key = object()  # identifies the decoded frames of the current image in the scene's frame cache
 
         self.loop = -1
         self.required_loop = 1
         self.start_second = scene.current_second
 
     def _draw(self, target: ImageDrawCombination, transform: Transform):
-        if transform.scale == (1, 1) and transform.angle == 0 and False:
-            # just a simple paste
-            target.image.paste(self._image, (int(transform.position[0] - transform.anchor[0]),
-                                             int(transform.position[1] - transform.anchor[1])))
-        else:
-            # use internal methods to prevent creating more non-pooled images
+        source = self.get_frame_image()
 
-            self._image.load()
+        if self.blit_optimization and transform.scale == (1, 1) and transform.angle == 0 and source.size == self._size:
+            x = transform.position[0] - transform.anchor[0]
+            y = transform.position[1] - transform.anchor[1]
 
-            if self._image.mode != "RGBA":
-                with self.scene.image_pool.request_image(self._image.width, self._image.height) as image:
-                    image.image.paste(self._image)
+            if float(x).is_integer() and float(y).is_integer():
+                # no resampling needed, just a composite of the image at its position
+                composite_at(target.image, source, int(x) - target.origin[0], int(y) - target.origin[1])
+                return
 
-                    target.image.im.transform2((0, 0, target.image.width, target.image.height),
-                                               image.image.im, Image.AFFINE, tuple(transform), self.image_resample, 0)
+        if self.mipmap_optimization:
+            source = self._get_mipmap(source, transform)
 
-            else:
-                target.image.im.transform2((0, 0, target.image.width, target.image.height),
-                                           self._image.im, Image.AFFINE, tuple(transform), self.image_resample, 0)
+        if source.size != self._size:
+            # the source is smaller than the image, it's scaled back to the size of the image
+            transform = transform_in_transform(transform, Transform(scale=(self._size[0] / source.width,
+                                                                           self._size[1] / source.height)))
+
+        draw_transformed(self.scene.image_pool, target, source, transform, self.image_resample)
+
+    def _get_mipmap(self, source: Image.Image, transform: Transform) -> Image.Image:
+        """Returns ``source`` reduced by the largest power of two that keeps it at least as large as when drawn"""
+        scale = max(abs(transform.scale[0]), abs(transform.scale[1])) * self._size[0] / source.width
+
+        if scale <= 0 or scale > 0.5:
+            return source
+
+        level = min(math.floor(math.log2(1 / scale)), math.floor(math.log2(min(source.size))))
+
+        if level <= 0:
+            return source
+
+        key = (self._frames_key, self._frame, "mipmap", level)
+        mipmap = self.scene.frame_cache.get(key)
+
+        if mipmap is None:
+            mipmap = source.reduce(2 ** level)
+            self.scene.frame_cache.put(key, mipmap, mipmap.width * mipmap.height * 4)
+
+        return mipmap
 
     @property
     def image(self):
@@ -46,19 +87,96 @@ class ImageComponent(DrawableComponent):
     @image.setter
     def image(self, value):
         self._image = value
+        self._size = value.size
         self.cache = None
+        self._rgba_image = None
+        self._frame = 0
+        self._frame_ends = None
+        self._frames_key = object()
+        self.reschedule()
+
+    @property
+    def frame(self):
+        """The index of the frame currently shown"""
+        return self._frame
+
+    def get_frame_image(self) -> Image.Image:
+        """Returns the current frame decoded as RGBA.
+        Animated frames go through the scene's frame cache, static images are converted once per source image,
+        so changes made in place to a non-RGBA source are only seen after assigning it to ``image`` again.
+        The image is only decoded on the first call, at a reduced size if ``decode_scale`` allows it."""
+        with self._decode_lock:
+            if not self.animated:
+                if self.decode_scale is not None and self._image.format == "JPEG" and self._image.tile:
+                    self._image.draft(self._image.mode, (math.ceil(self._size[0] * self.decode_scale),
+                                                         math.ceil(self._size[1] * self.decode_scale)))
+
+                self._image.load()
+
+                if self._image.mode == "RGBA":
+                    return self._image
+
+                if self._rgba_image is None:
+                    self._rgba_image = self._image.convert("RGBA")
+
+                return self._rgba_image
+
+            key = (self._frames_key, self._frame)
+            frame = self.scene.frame_cache.get(key)
+
+            if frame is None:
+                self._image.seek(self._frame)
+                frame = self._image.convert("RGBA")
+                self.scene.frame_cache.put(key, frame, frame.width * frame.height * 4)
+
+            return frame
+
+    def prepare_draw(self, transform: Transform):
+        super().prepare_draw(transform)
+
+        source = self.get_frame_image()
+
+        if self.mipmap_optimization:
+            self._get_mipmap(source, self.get_world_transform(transform))
+
+    @property
+    def start_second(self):
+        return self._start_second
+
+    @start_second.setter
+    def start_second(self, value):
+        self._start_second = value
+        self.reschedule()
+
+    @property
+    def loop(self):
+        return self._loop
+
+    @loop.setter
+    def loop(self, value):
+        self._loop = value
+        self.reschedule()
+
+    @property
+    def required_loop(self):
+        return self._required_loop
+
+    @required_loop.setter
+    def required_loop(self, value):
+        self._required_loop = value
+        self.reschedule()
 
     @property
     def width(self):
-        return self._image.width
+        return self._size[0]
 
     @property
     def height(self):
-        return self._image.height
+        return self._size[1]
 
     @property
     def size(self):
-        return self._image.size
+        return self._size
 
     @property
     def animated(self):
@@ -90,42 +208,80 @@ class ImageComponent(DrawableComponent):
 
         return cache
 
-    def get_active_box(self):
-        return get_box_from_transform(self.transform, (
-            (0, 0),
-            (0, self.height),
-            (self.width, self.height),
-            (self.width, 0)
-        ))
+    def get_local_box(self):
+        return 0, 0, self.width, self.height
+
+    def get_render_state(self):
+        return (self._frames_key, self._frame, self.image_resample, self.blit_optimization, self.mipmap_optimization,
+                self.decode_scale)
 
     def cleanup(self):
-        self._image.close()
+        # images from the asset cache are used by other scenes too
+        if not is_shared(self._image):
+            self._image.close()
 
     def reset(self):
         self.start_second = self.scene.current_second
 
+    def _show_frame(self, frame, _):
+        self._frame = frame
+
+    def _get_frame_ends(self):
+        durations = self.get_durations()
+
+        # durations may come from a keyed cache shared with other components, so the index follows its identity
+        if self._frame_ends is None or self._frame_ends[0] is not durations:
+            self._frame_ends = (durations, list(itertools.accumulate(durations)))
+
+        return self._frame_ends[1]
+
+    def _frame_boundary(self, ends, current_loop, frame):
+        return self.start_second + current_loop * ends[-1] + ends[frame]
+
     def get_next_update(self, t) -> typing.Optional[typing.Tuple[typing.Optional[float], typing.Callable, bool]]:
         if self.animated and self.loop != 0:
-            durations = self.get_durations()
-            anim_second = t - self.start_second
+            if t < self.start_second:
+                return self.start_second, functools.partial(self._show_frame, 0), self.required_loop in (-1, 0)
+
+            ends = self._get_frame_ends()
+            loop_duration = ends[-1]
+
+            if loop_duration <= 0:
+                return
+
+            # the next update is at the end of the first frame that ends after t
+            current_loop = math.floor((t - self.start_second) / loop_duration)
+            frame = bisect.bisect_right(ends, t - self.start_second - current_loop * loop_duration)
+
+            if frame >= len(ends):
+                frame = 0
+                current_loop += 1
+
+            # the estimate can be a frame off due to floating point error
+            while True:
+                if frame:
+                    previous_loop, previous_frame = current_loop, frame - 1
+
+                else:
+                    previous_loop, previous_frame = current_loop - 1, len(ends) - 1
+
+                if previous_loop < 0 or self._frame_boundary(ends, previous_loop, previous_frame) <= t:
+                    break
 
-            if anim_second < 0:
-                return self.start_second, lambda _: self._image.seek(0), self.required_loop in (-1, 0)
+                current_loop, frame = previous_loop, previous_frame
 
-            current_frame = 0
-            current_loop = 1
-            current_duration = 0
+            while self._frame_boundary(ends, current_loop, frame) <= t:
+                frame += 1
 
-            while current_duration <= anim_second:
-                if current_frame >= len(durations):
-                    current_frame = 0
+                if frame >= len(ends):
+                    frame = 0
                     current_loop += 1
 
-                    if current_loop > self.loop != -1:
-                        return
+            # loops are counted from 1
+            current_loop += 1
 
-                current_duration += durations[current_frame]
-                current_frame += 1
+            if current_loop > self.loop != -1:
+                return
 
-            return (current_duration + self.start_second, lambda _: self._image.seek(current_frame - 1),
+            return (self._frame_boundary(ends, current_loop - 1, frame), functools.partial(self._show_frame, frame),
                     current_loop <= self.required_loop or self.required_loop == -1)
@@ -1,5 +1,6 @@
+
 from ..drawer import ImageDrawCombination
-from ..component import DrawableComponent, get_box_from_transform
+from ..component import DrawableComponent
 from ..transform import Transform
 
 
@@ -14,12 +15,16 @@ class RectangleComponent(DrawableComponent):
         self.rectangle_optimization = True
 
     def _draw(self, target: ImageDrawCombination, transform: Transform):
+        # pillow truncates the coordinates, they're truncated in the coordinates of the frame before being moved
+        # to the target instead, so images holding a region of a frame get the same pixels as the frame
+        origin_x, origin_y = target.origin
+
         if self.rectangle_optimization and transform.angle == 0:
             target.draw.rectangle((
-                transform.position[0] - (transform.scale[0] * transform.anchor[0]),
-                transform.position[1] - (transform.scale[1] * transform.anchor[1]),
-                (transform.position[0] + self.width) - (transform.scale[0] * transform.anchor[0]),
-                (transform.position[1] + self.height) - (transform.scale[1] * transform.anchor[1])
+                int(transform.position[0] - (transform.scale[0] * transform.anchor[0])) - origin_x,
+                int(transform.position[1] - (transform.scale[1] * transform.anchor[1])) - origin_y,
+                int(transform.position[0] + transform.scale[0] * (self.width - transform.anchor[0])) - origin_x,
+                int(transform.position[1] + transform.scale[1] * (self.height - transform.anchor[1])) - origin_y
             ), fill=self.fill)
 
         else:
@@ -30,12 +35,34 @@ class RectangleComponent(DrawableComponent):
                 transform.solve((self.width, 0))
             )
 
-            target.draw.polygon(points, self.fill)
+            points = [(int(x), int(y)) for x, y in points]
+            bounds = target.bounds
+
+            if bounds is None or target.origin == bounds[:2]:
+                target.draw.polygon([(x - origin_x, y - origin_y) for x, y in points], self.fill)
+                return
+
+            # the pixels pillow fills for a polygon depend on where it is in the image, not just on the pixels it
+            # covers. it's drawn on a mask starting at the corner of the frame instead, like on the frame itself
+            left = origin_x - bounds[0]
+            top = origin_y - bounds[1]
+            right = min(max(x for x, _ in points) + 1, origin_x + target.image.width, bounds[2]) - bounds[0]
+            bottom = min(max(y for _, y in points) + 1, origin_y + target.image.height, bounds[3]) - bounds[1]
+            points = [(x - bounds[0], y - bounds[1]) for x, y in points]
+
+            if left >= right or top >= bottom:
+                return
+
+            with self.scene.image_pool.request_image(right, bottom, "L", exact_dimensions=False,
+                                                     track_writes=True) as mask:
+                mask.draw.polygon(points, 255)
+                mask.mark_dirty((min(x for x, _ in points), min(y for _, y in points),
+                                 max(x for x, _ in points) + 1, max(y for _, y in points) + 1))
+                target.image.paste(self.fill, (0, 0, right - left, bottom - top),
+                                   mask.image.crop((left, top, right, bottom)))
+
+    def get_local_box(self):
+        return 0, 0, self.width, self.height
 
-    def get_active_box(self):
-        return get_box_from_transform(self.transform, (
-            (0, 0),
-            (0, self.height),
-            (self.width, self.height),
-            (self.width, 0)
-        ))
+    def get_render_state(self):
+        return self.width, self.height, self.fill, self.rectangle_optimization
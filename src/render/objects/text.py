@@ -1,33 +1,72 @@
+import functools
 import typing
 
-from PIL import Image
+from PIL import Image, ImageDraw
 
-from ..component import DrawableComponent
+from ..component import DrawableComponent, draw_transformed
 from ..drawer import ImageDrawCombination
 from ..transform import Transform
 
 
+_measuring_draw: typing.Optional[ImageDraw.ImageDraw] = None
+
+
+@functools.lru_cache(maxsize=1024)
+def _measure_text(text, font=None):
+    global _measuring_draw
+
+    if _measuring_draw is None:
+        _measuring_draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+
+    _, _, width, height = _measuring_draw.textbbox((0, 0), text, font)
+    return width, height
+
+
 class TextComponent(DrawableComponent):
-    def __init__(self, scene, text="", font=None):
+    def __init__(self, scene, text="", font=None, fill=None):
         super().__init__(scene)
 
         self.text = text
         self.font = font
+        self.fill = fill
 
     def _draw(self, target: ImageDrawCombination, transform: Transform):
         if transform.scale == (1, 1) and transform.angle == 0:
             # just a simple paste
-            target.draw.text((int(transform.position[0] - transform.anchor[0]),
-                              int(transform.position[1] - transform.anchor[1])), self.text)
+            target.draw.text((int(transform.position[0] - transform.anchor[0]) - target.origin[0],
+                              int(transform.position[1] - transform.anchor[1]) - target.origin[1]),
+                             self.text, self.fill, self.font)
         else:
-            with self.scene.image_pool.request_image(target.width, target.height) as image:
-                image.draw.text((0, 0), self.text)
+            raster = self.get_raster()
+
+            if raster is not None:
+                draw_transformed(self.scene.image_pool, target, raster, transform, Image.NEAREST)
+
+    def get_raster(self) -> typing.Optional[Image.Image]:
+        """Returns the text drawn on an image of its size, cached by the scene for the same text, font and fill.
+        None if the text covers no pixels"""
+        width, height = _measure_text(self.text, self.font)
+
+        if width <= 0 or height <= 0:
+            return None
+
+        key = (self.text, self.font, self.fill)
+        raster = self.scene.text_cache.get(key)
+
+        if raster is None:
+            raster = Image.new("RGBA", (width, height))
+            ImageDraw.Draw(raster).text((0, 0), self.text, self.fill, self.font)
+            self.scene.text_cache.put(key, raster, width * height * 4)
+
+        return raster
 
-                with self.scene.image_pool.request_image(target.width, target.height) as intermediary:
-                    intermediary.image.im.transform2((0, 0, intermediary.image.width, intermediary.image.height),
-                                                     image.im, Image.AFFINE, tuple(transform), Image.NEAREST, 0)
+    def prepare_draw(self, transform: Transform):
+        super().prepare_draw(transform)
+        self.get_raster()
 
-                    target.image.alpha_composite(intermediary.image)
+    def get_local_box(self) -> typing.Tuple[float, float, float, float]:
+        width, height = _measure_text(self.text, self.font)
+        return 0, 0, width, height
 
-    def get_active_box(self) -> typing.Tuple[float, float, float, float]:
-        pass
+    def get_render_state(self):
+        return self.text, self.font, self.fill
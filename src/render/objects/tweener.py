@@ -1,23 +1,61 @@
 from __future__ import annotations
 
 import inspect
+import math
 import types
 import typing
 
+import numpy as np
 import pytweening
 
+from ..cache import LRUCache
 from ..component import Component
 
 if typing.TYPE_CHECKING:
     from ..scene import Scene
 
 
+# keyed by (tween, sample rate, duration), bounded since durations are arbitrary floats
+_easing_tables = LRUCache(8 * 1024 * 1024)
+
+
+def _get_tween(tween) -> types.FunctionType:
+    func = getattr(pytweening, tween, lambda: None)
+
+    if len(inspect.signature(func).parameters) != 1:
+        raise ValueError(f"{tween} is not a valid tween name")
+
+    return func
+
+
+def get_easing_table(tween, sample_rate, duration) -> np.ndarray:
+    """Returns the eased progress of every sample of a tween, the last entry always being the end of the tween.
+    The most recently used tables are cached per tween, sample rate and duration."""
+    key = (tween, sample_rate, duration)
+    table = _easing_tables.get(key)
+
+    if table is None:
+        func = _get_tween(tween)
+        total = duration * sample_rate
+        count = max(math.ceil(total), 1)
+
+        table = np.array([func(min(index / total, 1)) if total > 0 else func(1) for index in range(count + 1)],
+                         dtype=np.float64)
+        table.flags.writeable = False
+        _easing_tables.put(key, table, table.nbytes)
+
+    return table
+
+
 class TweenComponent(Component):
     def __init__(self, scene: Scene, tween, callback, *, duration, start_second=None, begin_value=0, end_value=1,
-                 required=True):
+                 required=True, sample_rate=60):
         super().__init__(scene)
         self.required = required
         self.callback = callback
+        self.sample_rate = sample_rate
+
+        self._update_func = self._update
 
         self.start_second = scene.current_second if start_second is None else start_second
         self.duration = duration
@@ -25,27 +63,253 @@ class TweenComponent(Component):
         self.end_value = end_value
         self.begin_value = begin_value
 
-        self.tween: types.FunctionType = getattr(pytweening, tween, lambda: None)
+        self.tween: types.FunctionType = _get_tween(tween)
+
+    @property
+    def start_second(self):
+        return self._start_second
+
+    @start_second.setter
+    def start_second(self, value):
+        self._start_second = value
+        self.reschedule()
+
+    @property
+    def duration(self):
+        return self._duration
+
+    @duration.setter
+    def duration(self, value):
+        self._duration = value
+        self.reschedule()
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, value):
+        if value <= 0:
+            raise ValueError("sample_rate must be positive")
+
+        self._sample_rate = value
+        self.reschedule()
 
-        if len(inspect.signature(self.tween).parameters) != 1:
-            raise ValueError(f"{tween} is not a valid tween name")
+    @property
+    def required(self):
+        return self._required
+
+    @required.setter
+    def required(self, value):
+        self._required = value
+        self.reschedule()
 
     def get_next_update(self, t) -> typing.Optional[typing.Tuple[typing.Optional[float], typing.Callable, bool]]:
         if t < self.start_second:
-            return self.start_second, lambda _: self.callback(self.begin_value), self.required
+            return self.start_second, self._update_func, self.required
+
+        end_second = self.start_second + self.duration
+
+        # index of the first sample strictly after t, samples are at start_second + index / sample_rate
+        index = math.floor((t - self.start_second) * self.sample_rate) + 1
+        next_update = self.start_second + index / self.sample_rate
+
+        if next_update <= t:
+            # floating point error landed the sample on t
+            next_update = self.start_second + (index + 1) / self.sample_rate
+
+        if next_update < end_second:
+            return next_update, self._update_func, self.required
+
+        return end_second, self._update_func, self.required
+
+    def _update(self, t):
+        if t <= self.start_second:
+            self.callback(self.begin_value)
+
+        elif t >= self.start_second + self.duration:
+            self.callback(self.end_value)
 
         else:
-            step_size = 1 / 60
+            tween_progress = (t - self.start_second) / self.duration
+            self.callback(self.tween(tween_progress) * (self.end_value - self.begin_value) + self.begin_value)
+
+
+class TweenGroupComponent(Component):
+    """Evaluates many tweens at once with NumPy, using precomputed easing tables instead of calling the tween
+    functions on every sample.
+
+    The group callback receives the values of every member as an array of shape (members, *value_shape),
+    members may also have their own callback, which is only called when their value changes."""
+
+    def __init__(self, scene: Scene, callback=None, *, required=True, sample_rate=60):
+        super().__init__(scene)
+        self._arrays = None
+        self._last_progress: typing.Optional[np.ndarray] = None
+
+        self.callback = callback
+        self.required = required
+        self.sample_rate = sample_rate
+
+        self._update_func = self._update
+
+        self._tweens: typing.List[str] = []
+        self._callbacks: typing.List[typing.Optional[typing.Callable]] = []
+        self._starts: typing.List[float] = []
+        self._durations: typing.List[float] = []
+        self._begin_values: typing.List[np.ndarray] = []
+        self._end_values: typing.List[np.ndarray] = []
+        self._value_shape: typing.Optional[typing.Tuple[int, ...]] = None
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, value):
+        if value <= 0:
+            raise ValueError("sample_rate must be positive")
+
+        self._sample_rate = value
+        self._arrays = None
+        self.reschedule()
+
+    @property
+    def required(self):
+        return self._required
+
+    @required.setter
+    def required(self, value):
+        self._required = value
+        self.reschedule()
+
+    def add(self, tween, callback=None, *, duration, start_second=None, begin_value=0, end_value=1) -> int:
+        """Adds a tween to the group
+
+        :return: The index of the tween's value in the arrays given to the group callback
+        """
+        _get_tween(tween)
+
+        try:
+            begin_value, end_value = (np.array(value, dtype=np.float64) for value in
+                                      np.broadcast_arrays(begin_value, end_value))
+
+        except ValueError:
+            raise ValueError("begin_value and end_value must have compatible shapes") from None
+
+        if self._value_shape is None:
+            self._value_shape = begin_value.shape
+
+        elif self._value_shape != begin_value.shape:
+            raise ValueError(f"Values of this group must have the shape {self._value_shape}")
+
+        self._tweens.append(tween)
+        self._callbacks.append(callback)
+        self._starts.append(self.scene.current_second if start_second is None else start_second)
+        self._durations.append(duration)
+        self._begin_values.append(begin_value)
+        self._end_values.append(end_value)
+
+        self._arrays = None
+        self.reschedule()
+
+        return len(self._tweens) - 1
+
+    def __len__(self):
+        return len(self._tweens)
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            starts = np.array(self._starts, dtype=np.float64)
+            durations = np.array(self._durations, dtype=np.float64)
+
+            # one table per tween, all concatenated so the lookup is a single fancy index
+            tables = [get_easing_table(tween, self.sample_rate, duration)
+                      for tween, duration in zip(self._tweens, self._durations)]
+            samples = np.array([len(table) - 1 for table in tables], dtype=np.int64)
+            offsets = np.zeros(len(tables), dtype=np.int64)
+            offsets[1:] = np.cumsum([len(table) for table in tables])[:-1]
+
+            self._arrays = (
+                starts,
+                durations,
+                samples,
+                offsets,
+                np.concatenate(tables),
+                np.stack(self._begin_values),
+                np.stack(self._end_values) - np.stack(self._begin_values)
+            )
+
+        return self._arrays
+
+    def get_next_update(self, t) -> typing.Optional[typing.Tuple[typing.Optional[float], typing.Callable, bool]]:
+        if not self._tweens:
+            return
+
+        starts, durations = self._get_arrays()[:2]
+        ends = starts + durations
+
+        index = np.floor((t - starts) * self.sample_rate) + 1
+        candidates = starts + index / self.sample_rate
+        # floating point error may land a sample on t
+        candidates = np.where(candidates <= t, starts + (index + 1) / self.sample_rate, candidates)
+        candidates = np.minimum(candidates, ends)
+
+        candidates = np.where(t < starts, starts, candidates)
+        candidates = np.where(t >= ends, np.inf, candidates)
+
+        next_update = candidates.min()
+
+        if next_update == np.inf:
+            return
+
+        return float(next_update), self._update_func, self.required
+
+    def values_at(self, t) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Computes the progress and the values of every tween at the second ``t``"""
+        starts, durations, samples, offsets, table, begin_values, value_ranges = self._get_arrays()
+
+        progress = np.divide(t - starts, durations,
+                             out=np.where(t >= starts, 1.0, 0.0), where=durations > 0)
+        np.clip(progress, 0, 1, out=progress)
+
+        # the samples are 1 / sample_rate apart, except for the last one which is the end of the tween
+        total = durations * self.sample_rate
+        position = progress * total
+        lower = np.minimum(np.floor(position).astype(np.int64), samples - 1)
+        span = np.minimum(lower + 1, total) - lower
+        fraction = np.divide(position - lower, span, out=np.zeros_like(position), where=span > 0)
+
+        eased = table[offsets + lower] * (1 - fraction) + table[offsets + lower + 1] * fraction
+
+        # the ends are exact, as with TweenComponent
+        eased = np.where(progress <= 0, 0.0, np.where(progress >= 1, 1.0, eased))
+
+        eased = eased.reshape((-1,) + (1,) * len(self._value_shape))
+        return progress, begin_values + eased * value_ranges
+
+    def _update(self, t):
+        progress, values = self.values_at(t)
+
+        if self.callback is not None:
+            self.callback(values)
+
+        last_progress = self._last_progress
+
+        if last_progress is None or len(last_progress) != len(progress):
+            # tweens that were never updated get nan so they always count as changed
+            padding = np.full(len(progress) - (0 if last_progress is None else len(last_progress)), np.nan)
+            last_progress = padding if last_progress is None else np.concatenate((last_progress, padding))
 
-            next_update = self.start_second
+        # like TweenComponent, members are first updated on their start second
+        started = t >= self._get_arrays()[0]
+        changed = np.flatnonzero(started & (progress != last_progress))
 
-            while next_update < self.start_second + self.duration:
-                next_update += step_size
+        self._last_progress = np.where(started, progress, last_progress)
 
-                if t < next_update < self.start_second + self.duration:
-                    tween_progress = (next_update - self.start_second) / self.duration
-                    return next_update, lambda _: self.callback(self.tween(tween_progress) *
-                                                                (self.end_value - self.begin_value)
-                                                                + self.begin_value), self.required
+        for index in changed:
+            callback = self._callbacks[index]
 
-            return self.start_second + self.duration, lambda _: self.callback(self.end_value), self.required
+            if callback is not None:
+                value = values[index]
+                callback(value.item() if value.ndim == 0 else tuple(value.tolist()))
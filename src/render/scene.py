@@ -1,27 +1,53 @@
 from __future__ import annotations
 
 import abc
+import asyncio
+import concurrent.futures
+import contextlib
+import hashlib
 import inspect
-import math
+import os
+import threading
 import typing
-from operator import attrgetter
 import time
 
-from .drawer import ImagePool
-from .component import Component, BaseLifecycleComponent, DrawableComponent
+from .cache import LRUCache
+from .drawer import (ImageDrawCombination, ImagePool, ImagePoolLease, ResampleCache, create_image,
+                     get_shared_image_pool)
+from .drawlist import DrawList
+from .scheduler import Scheduler
+from .component import (Component, BaseLifecycleComponent, DrawableComponent, boxes_intersect, get_pixel_box,
+                        get_visible_components, get_world_boxes, mark_drawn_boxes, merge_boxes)
 from .objects.container import ContainerComponent
 from .objects.image import ImageComponent
 from .objects.primitive import RectangleComponent
 from .objects.text import TextComponent
 from .objects.thread import ThreadComponent
-from .objects.tweener import TweenComponent
+from .objects.tweener import TweenComponent, TweenGroupComponent
 
 from .transform import Transform
 
 
+async def run_in_executor(executor, func, *args):
+    """Runs ``func`` in ``executor``. If the caller is cancelled, the call is still waited for
+    before the cancellation propagates, as it cannot be interrupted"""
+    future = asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    try:
+        return await asyncio.shield(future)
+
+    except asyncio.CancelledError:
+        await asyncio.wait((future,))
+        raise
+
+
 class Scene(BaseLifecycleComponent, abc.ABC):
     object_registry: typing.Dict[str, typing.Type[Component]] = {}
 
+    # when set, the scene draws with images from a pool shared by the whole process instead of its own,
+    # so they can be reused by the scenes rendered after it
+    shared_image_pool = False
+
     def __init_subclass__(cls, **kwargs):
         cls.cache_keys = {}
 
@@ -32,10 +58,12 @@ class Scene(BaseLifecycleComponent, abc.ABC):
 
         super().__init__(self)
 
+        self.scheduler = Scheduler()
+
         self.processing_objects: typing.List[Component] = []
-        self.processing_objects.append(self)
+        self.process_object(self)
 
-        self.drawing_objects: typing.List[DrawableComponent] = []
+        self.drawing_objects = DrawList()
 
         self.min_frame_duration = 1 / 60
         self.min_duration = 0
@@ -43,7 +71,11 @@ class Scene(BaseLifecycleComponent, abc.ABC):
         self._width = 0
         self._height = 0
 
-        self.image_pool: typing.Optional[ImagePool] = None
+        self.image_pool: typing.Optional[typing.Union[ImagePool, ImagePoolLease]] = None
+        # decoded animation frames, bounded in bytes by frame_cache_size. an animation whose frames don't all fit
+        # is decoded again on every loop, since a looping animation always needs its least recently used frame next
+        self.frame_cache = LRUCache(64 * 1024 * 1024)
+        self.text_cache = LRUCache(16 * 1024 * 1024)  # rasterized text, bounded in bytes
 
         self.initial_transform = Transform()
 
@@ -52,10 +84,54 @@ class Scene(BaseLifecycleComponent, abc.ABC):
 
         self.current_image = None
 
+        # objects that don't land on the canvas are skipped
+        self.culling = True
+        self.culled_objects = 0
+        self.drawn_objects = 0
+        self._stats_lock = threading.Lock()
+
+        # when set, frames are split in tiles of this size that are drawn concurrently by render_threads threads,
+        # the amount of threads is read when the first tiled frame is rendered.
+        # it can't be combined with incremental_rendering
+        self.tile_size: typing.Optional[int] = None
+        self.render_threads = os.cpu_count() or 1
+        self._tile_executor: typing.Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+        # when enabled, only the regions of the previous frame that changed are drawn again
+        self.incremental_rendering = False
+        # above this fraction of the canvas being damaged, the whole frame is drawn again
+        self.full_redraw_ratio = 0.5
+
+        self._frame_buffer: typing.Optional[ImageDrawCombination] = None
+        self._frame_lease: typing.Optional[contextlib.ExitStack] = None
+        self._frame_states: typing.Dict[DrawableComponent, tuple] = {}
+
         self._has_yielded = False
 
+        # when enabled, frames that are visually identical to the previous one are merged into it.
+        # if any drawable can't describe its state, every frame is hashed to find out
+        self.coalesce_frames = False
+
+        self._frame_state = None
+        self._frame_digest = None
+        self._pending_duration: typing.Optional[float] = None
+
+        # when set, only the frames with these indices are rendered, the others yield None as their image.
+        # frames are never coalesced in this case, so indices match the frames of a non coalescing render
+        self.rendered_frames: typing.Optional[range] = None
+        # the index of the frame currently shown, counting the frames merged by coalescing
+        self.frame_index = -1
+
         self.initialize_image_pool()
 
+    @property
+    def frame_cache_size(self):
+        return self.frame_cache.max_size
+
+    @frame_cache_size.setter
+    def frame_cache_size(self, value):
+        self.frame_cache.max_size = value
+
     @property
     def width(self):
         return self._width
@@ -82,36 +158,18 @@ class Scene(BaseLifecycleComponent, abc.ABC):
     def first_frame(self):
         return self._first_frame
 
+    @property
+    def _shown_image(self):
+        return None if self.current_image is None else self.current_image.image
+
     def __iter__(self):
         self._update(self.current_second)
 
         try:
             while True:
                 start = time.perf_counter()
-                next_second = math.inf
-                update_funcs = []
-                update_required = False
-
-                for obj in self.processing_objects:
-                    candidate_update_collection = obj.get_next_update(self.current_second)
-
-                    if candidate_update_collection is not None:
-                        candidate_second, candidate_func, is_required = candidate_update_collection
-
-                        if self.first_frame:
-                            should_add = 0 <= candidate_second <= next_second
-
-                        else:
-                            should_add = self.current_second < candidate_second <= next_second
-
-                        if should_add:
-                            if candidate_second < next_second:
-                                update_funcs.clear()
-                                next_second = candidate_second
-
-                            update_funcs.append(candidate_func)
-
-                            update_required = update_required or is_required
+                next_second, update_funcs, update_required = self.scheduler.pop_next(self.current_second,
+                                                                                     self.first_frame)
 
                 self.process_time += time.perf_counter() - start
 
@@ -122,63 +180,367 @@ class Scene(BaseLifecycleComponent, abc.ABC):
                         func(next_second)
 
                     if self._first_frame or self.min_frame_duration < self.current_second - self.current_frame_second:
-                        self.current_image = self.render_frame()
-                        old_frame_second = self.current_frame_second
-                        self.current_frame_second = self.current_second
+                        if self.coalesce_frames and self.rendered_frames is None:
+                            yield from self._coalesce_frame()
 
-                        if not self._first_frame:
-                            yield self.current_image.image, self.current_second - old_frame_second
-                            self._has_yielded = True
+                        else:
+                            self.frame_index += 1
+
+                            if self.rendered_frames is None or self.frame_index in self.rendered_frames:
+                                self.current_image = self.render_frame()
+
+                            else:
+                                self.current_image = None
+
+                            old_frame_second = self.current_frame_second
+                            self.current_frame_second = self.current_second
+
+                            if not self._first_frame:
+                                yield self._shown_image, self.current_second - old_frame_second
+                                self._has_yielded = True
 
                         self._first_frame = False
 
                 else:
                     if self.min_duration > self.current_second:
-                        yield self.current_image.image, self.min_duration - self.current_second
+                        if self.coalesce_frames:
+                            # the padding shows the last frame, so it only extends it
+                            self._pending_duration = ((self._pending_duration or 0) +
+                                                      self.min_duration - self.current_second)
+
+                        else:
+                            yield self._shown_image, self.min_duration - self.current_second
+                            self._has_yielded = True
+
+                    if self._pending_duration is not None:
+                        yield self._shown_image, self._pending_duration
+                        self._pending_duration = None
                         self._has_yielded = True
 
                     if not self._has_yielded:
-                        yield self.current_image.image, 0
+                        yield self._shown_image, 0
 
                     break
 
         finally:
             self.cleanup_objects()
 
+    async def frames_async(self, executor=None):
+        """Same as iterating the scene, but the frames are rendered in ``executor`` (the loop's default one if None)
+        so the event loop is free in the meantime"""
+        frames = iter(self)
+
+        try:
+            while True:
+                frame = await run_in_executor(executor, next, frames, None)
+
+                if frame is None:
+                    return
+
+                yield frame
+
+        finally:
+            frames.close()
+
+    def __aiter__(self):
+        return self.frames_async()
+
+    def get_frame_state(self) -> typing.Optional[typing.Hashable]:
+        """Returns a value that changes whenever the rendered frame would change, None if it cannot be known"""
+        states = []
+
+        for obj in self.drawing_objects:
+            state = obj.get_draw_state(self.initial_transform)
+
+            if state is None:
+                return None
+
+            states.append((obj, state))
+
+        return self.width, self.height, tuple(states)
+
+    def _coalesce_frame(self):
+        """Renders a frame unless it would be identical to the previous one, in which case the previous frame
+        is kept and shown for longer. Frames are held back until the next different frame is found."""
+        self.frame_index += 1
+
+        duration = self.current_second - self.current_frame_second
+        self.current_frame_second = self.current_second
+
+        state = self.get_frame_state()
+
+        if not self._first_frame and state is not None and state == self._frame_state:
+            self._pending_duration = (self._pending_duration or 0) + duration
+            return
+
+        pending_image = None
+
+        if self._pending_duration is not None:
+            if state is None:
+                # whether the held back frame changed is only known after rendering over it
+                pending_image = self.current_image.image.copy()
+
+            else:
+                yield self.current_image.image, self._pending_duration
+                self._pending_duration = None
+                self._has_yielded = True
+
+        self.current_image = self.render_frame()
+
+        digest = None
+
+        if state is None:
+            digest = hashlib.blake2b(self.current_image.image.tobytes(), digest_size=16).digest()
+
+        if not self._first_frame:
+            if digest is not None and digest == self._frame_digest:
+                self._pending_duration = (self._pending_duration or 0) + duration
+
+            else:
+                if pending_image is not None:
+                    yield pending_image, self._pending_duration
+                    self._has_yielded = True
+
+                self._pending_duration = duration
+
+        self._frame_state = state
+        self._frame_digest = digest
+
     def initialize_image_pool(self):
-        self.image_pool = ImagePool()
+        if self.shared_image_pool:
+            self.image_pool = ImagePoolLease(get_shared_image_pool())
+        else:
+            self.image_pool = ImagePool()
 
     def draw_object(self, obj):
-        self.drawing_objects.append(obj)
+        self.drawing_objects.add(obj)
 
     def remove_draw_object(self, obj):
         self.drawing_objects.remove(obj)
 
     def process_object(self, obj):
         self.processing_objects.append(obj)
+        self.scheduler.add(obj)
 
     def remove_process_object(self, obj):
         self.processing_objects.remove(obj)
+        self.scheduler.remove(obj)
 
     def render_frame(self):
         start = time.perf_counter()
-        with self.image_pool.request_image(self.width, self.height) as comb:
-            s = sorted(self.drawing_objects, key=attrgetter("z"))
 
-            for obj in s:
-                obj.draw(comb, self.initial_transform)
+        if self.incremental_rendering:
+            if self.tile_size is not None:
+                raise RuntimeError("Incremental rendering cannot be combined with tiles")
 
+            comb = self._render_incremental_frame()
             self.render_time += time.perf_counter() - start
-
             return comb
 
+        # the frame stays in use until the next one is rendered, so the pool can't hand it out or evict it
+        lease = contextlib.ExitStack()
+        comb = lease.enter_context(self.image_pool.request_image(self.width, self.height, track_writes=True))
+
+        objects = self._cull(self.drawing_objects)
+        boxes = get_world_boxes(objects, self.initial_transform)
+
+        # only what is drawn now has to be cleared when the image is reused
+        mark_drawn_boxes(comb, boxes)
+
+        if self.tile_size is not None:
+            self._render_tiles(comb, objects, boxes)
+
+        else:
+            for obj in objects:
+                obj.draw(comb, self.initial_transform)
+
+        self._release_frame()
+        self._frame_lease = lease
+
+        self.render_time += time.perf_counter() - start
+
+        return comb
+
+    def _render_tiles(self, frame: ImageDrawCombination, objects, boxes):
+        # everything that could be loaded lazily is loaded here, before objects are drawn by several threads
+        for obj in objects:
+            obj.prepare_draw(self.initial_transform)
+
+        boxes = [get_pixel_box(box) for box in boxes]
+
+        if self._tile_executor is None:
+            self._tile_executor = concurrent.futures.ThreadPoolExecutor(self.render_threads,
+                                                                        thread_name_prefix="render-tile")
+
+        paste_lock = threading.Lock()
+        resample_cache = ResampleCache(self.image_pool)
+        futures = []
+
+        for top in range(0, self.height, self.tile_size):
+            for left in range(0, self.width, self.tile_size):
+                tile = (left, top, min(left + self.tile_size, self.width), min(top + self.tile_size, self.height))
+
+                tile_objects = [(obj, box) for obj, box in zip(objects, boxes)
+                                if box is None or boxes_intersect(box, tile)]
+
+                if tile_objects:
+                    futures.append(self._tile_executor.submit(self._render_tile, frame, tile, tile_objects,
+                                                              resample_cache, paste_lock))
+
+        try:
+            concurrent.futures.wait(futures)
+
+            for future in futures:
+                future.result()
+
+        finally:
+            resample_cache.close()
+
+    def _render_tile(self, frame: ImageDrawCombination, tile, objects, resample_cache: ResampleCache,
+                     paste_lock: threading.Lock):
+        left, top, right, bottom = tile
+
+        with self.image_pool.request_image(right - left, bottom - top, track_writes=True) as tile_image:
+            self._draw_region(tile_image, tile, objects, resample_cache)
+
+            with paste_lock:
+                frame.image.paste(tile_image.image, (left, top))
+
+    def _draw_region(self, target: ImageDrawCombination, region, objects, resample_cache: ResampleCache):
+        """Draws the objects, given with their pixel boxes, on an image holding a region of the frame.
+        They are drawn in the coordinates of the frame, so the region gets the same pixels as the whole frame"""
+        target.origin = region[:2]
+        target.bounds = (0, 0, self.width, self.height)
+        target.resample_cache = resample_cache
+
+        for obj, box in objects:
+            mark_drawn_boxes(target, [box])
+            obj.draw(target, self.initial_transform)
+
+    def _cull(self, objects):
+        culled = 0
+
+        if self.culling:
+            visible = get_visible_components(objects, self.initial_transform, (0, 0, self.width, self.height))
+            culled = len(objects) - len(visible)
+            objects = visible
+
+        self.count_objects(len(objects), culled)
+
+        return objects
+
+    def count_objects(self, drawn, culled=0):
+        """Adds to the drawn and culled object counters, tiles may be drawn by several threads at once"""
+        with self._stats_lock:
+            self.drawn_objects += drawn
+            self.culled_objects += culled
+
+    def _release_frame(self):
+        if self._frame_lease is not None:
+            self._frame_lease.close()
+            self._frame_lease = None
+
+    def _get_damaged_regions(self, states):
+        """Returns the pixel regions that changed since the previous frame, None if the whole frame has to be drawn"""
+        damage = []
+
+        for obj, (state, box) in states.items():
+            previous = self._frame_states.get(obj)
+
+            if box is None:
+                return None
+
+            if previous is None:
+                damage.append(box)
+
+            elif state is None or previous[0] != state:
+                if previous[1] is None:
+                    return None
+
+                damage.append(previous[1])
+                damage.append(box)
+
+        for obj, (_, box) in self._frame_states.items():
+            if obj not in states:
+                if box is None:
+                    return None
+
+                damage.append(box)
+
+        regions = []
+
+        for box in damage:
+            region = (max(box[0], 0), max(box[1], 0), min(box[2], self.width), min(box[3], self.height))
+
+            if region[0] < region[2] and region[1] < region[3]:
+                regions.append(region)
+
+        regions = merge_boxes(regions)
+
+        area = sum((region[2] - region[0]) * (region[3] - region[1]) for region in regions)
+
+        if area > self.width * self.height * self.full_redraw_ratio:
+            return None
+
+        return regions
+
+    def _render_incremental_frame(self):
+        s = self.drawing_objects
+
+        states = {obj: (obj.get_draw_state(self.initial_transform), get_pixel_box(box))
+                  for obj, box in zip(s, get_world_boxes(s, self.initial_transform))}
+
+        if self._frame_buffer is None:
+            self._frame_buffer = create_image(self.width, self.height)
+            regions = None
+
+        else:
+            regions = self._get_damaged_regions(states)
+
+        frame = self._frame_buffer
+
+        if regions is None:
+            frame.draw.rectangle((0, 0, frame.image.width, frame.image.height), (0, 0, 0, 0))
+
+            for obj in self._cull(s):
+                obj.draw(frame, self.initial_transform)
+
+        else:
+            # regions can share the drawings they resample
+            with contextlib.closing(ResampleCache(self.image_pool)) as resample_cache:
+                for region in regions:
+                    left, top, right, bottom = region
+
+                    with self.image_pool.request_image(right - left, bottom - top, track_writes=True) as region_image:
+                        self._draw_region(region_image, region, [(obj, states[obj][1]) for obj in s
+                                                                 if boxes_intersect(states[obj][1], region)],
+                                          resample_cache)
+
+                        frame.image.paste(region_image.image, (left, top))
+
+        self._frame_states = states
+
+        return frame
+
     def cleanup_objects(self):
         for obj in self.processing_objects:
             obj.cleanup()
 
+        if self._frame_buffer is not None:
+            self._frame_buffer.image.close()
+
+        self._release_frame()
+
+        if self._tile_executor is not None:
+            self._tile_executor.shutdown()
+            self._tile_executor = None
+
         if self.image_pool is not None:
             self.image_pool.close()
 
+        self.frame_cache.clear()
+        self.text_cache.clear()
+
     def create(self, cls, *args, **kwargs):
         init_kwargs = {}
         set_kwargs = {}
@@ -248,6 +610,7 @@ Scene.object_registry["image"] = ImageComponent
 Scene.object_registry["thread"] = ThreadComponent
 Scene.object_registry["rectangle"] = RectangleComponent
 Scene.object_registry["tween"] = TweenComponent
+Scene.object_registry["tween_group"] = TweenGroupComponent
 Scene.object_registry["text"] = TextComponent
 Scene.object_registry["container"] = ContainerComponent
 Scene.object_registry["empty"] = Component
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import math
+import typing
+
+if typing.TYPE_CHECKING:
+    from .component import Component
+
+
+class Scheduler:
+    """Priority queue of the next update of every processed component.
+
+    Components are only asked for their next update when they are added, after they have been dispatched
+    or after they called :meth:`Component.reschedule`, so finding the next event does not depend on the amount
+    of idle components in the scene."""
+
+    def __init__(self):
+        # entries are [second, order, component, func, required], component is None once invalidated
+        self._heap: typing.List[list] = []
+        self._entries: typing.Dict[Component, list] = {}
+        self._order: typing.Dict[Component, int] = {}
+        self._pending: typing.Dict[Component, None] = {}  # used as an ordered set
+        self._counter = itertools.count()
+        # amount of live entries in the heap that are required
+        self._required = 0
+
+    def add(self, component: Component):
+        self._order[component] = next(self._counter)
+        self._pending[component] = None
+
+    def remove(self, component: Component):
+        del self._order[component]
+        self._pending.pop(component, None)
+        self._drop_entry(component)
+
+    def invalidate(self, component: Component):
+        if component in self._order:
+            self._pending[component] = None
+
+    def _drop_entry(self, component):
+        entry = self._entries.pop(component, None)
+
+        if entry is not None:
+            entry[2] = None
+
+            if entry[4]:
+                self._required -= 1
+
+    def _refresh(self, t):
+        while self._pending:
+            # a component may invalidate other components while reporting its next update
+            pending = self._pending
+            self._pending = {}
+
+            for component in pending:
+                self._drop_entry(component)
+
+                update = component.get_next_update(t)
+
+                if update is not None:
+                    second, func, required = update
+                    entry = [second, self._order[component], component, func, required]
+                    self._entries[component] = entry
+                    heapq.heappush(self._heap, entry)
+
+                    if required:
+                        self._required += 1
+
+    def pop_next(self, t, first_frame=False) -> typing.Tuple[float, typing.List[typing.Callable], bool]:
+        """Removes every update due at the earliest second after ``t`` (or at/after 0 on the first frame).
+
+        :return: The second of the updates, their functions in processing order, and if any of them
+        or any update still scheduled after them is required
+        """
+        self._refresh(t)
+
+        heap = self._heap
+
+        while heap and (heap[0][2] is None or (heap[0][0] < 0 if first_frame else heap[0][0] <= t)):
+            # updates that are already in the past are never reached again until the component reschedules
+            entry = heapq.heappop(heap)
+
+            if entry[2] is not None:
+                del self._entries[entry[2]]
+
+                if entry[4]:
+                    self._required -= 1
+
+        if not heap:
+            return math.inf, [], False
+
+        second = heap[0][0]
+        funcs = []
+        required = False
+
+        while heap and heap[0][0] == second:
+            _, _, component, func, is_required = heapq.heappop(heap)
+
+            if component is None:
+                continue
+
+            del self._entries[component]
+            self._pending[component] = None
+
+            funcs.append(func)
+
+            if is_required:
+                self._required -= 1
+                required = True
+
+        return second, funcs, required or self._required > 0
+
+    def __len__(self):
+        return len(self._order)
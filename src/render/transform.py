@@ -1,39 +1,99 @@
-import copy
 import math
 import typing
 
 import numpy as np
 
 
-def _solve(pos, matrix) -> typing.Tuple[float, float]:
-    matrix = matrix * (*pos, 1)
-    matrix = matrix.sum(1)
-    return tuple(matrix[:2])
+class Affine:
+    """A 2D affine matrix, the first two rows of a 3x3 matrix whose last row is (0, 0, 1).
+    Iterating gives its six values in the order expected by Pillow"""
+
+    __slots__ = ("a", "b", "c", "d", "e", "f")
+
+    def __init__(self, a, b, c, d, e, f):
+        self.a = a
+        self.b = b
+        self.c = c
+        self.d = d
+        self.e = e
+        self.f = f
+
+    def __matmul__(self, other):
+        if isinstance(other, Affine):
+            return Affine(
+                self.a * other.a + self.b * other.d,
+                self.a * other.b + self.b * other.e,
+                self.a * other.c + self.b * other.f + self.c,
+                self.d * other.a + self.e * other.d,
+                self.d * other.b + self.e * other.e,
+                self.d * other.c + self.e * other.f + self.f
+            )
+
+        return NotImplemented
+
+    def inverse(self):
+        determinant = self.a * self.e - self.b * self.d
+
+        a = self.e / determinant
+        b = -self.b / determinant
+        d = -self.d / determinant
+        e = self.a / determinant
 
+        return Affine(a, b, -(a * self.c + b * self.f), d, e, -(d * self.c + e * self.f))
 
-def _values_from_matrix(matrix):
-    yield from matrix[0]
-    yield from matrix[1]
+    def solve(self, pos) -> typing.Tuple[float, float]:
+        x, y = pos
+        return self.a * x + self.b * y + self.c, self.d * x + self.e * y + self.f
+
+    def solve_many(self, points) -> np.ndarray:
+        """Maps an (N, 2) array of points at once"""
+        points = np.asarray(points, dtype=float)
+        x = points[:, 0]
+        y = points[:, 1]
+        return np.stack((self.a * x + self.b * y + self.c, self.d * x + self.e * y + self.f), 1)
+
+    def __iter__(self):
+        yield self.a
+        yield self.b
+        yield self.c
+        yield self.d
+        yield self.e
+        yield self.f
+
+    def __array__(self, dtype=None):
+        return np.array([
+            [self.a, self.b, self.c],
+            [self.d, self.e, self.f],
+            [0, 0, 1]
+        ], dtype=dtype)
+
+    def __repr__(self):
+        return f"{type(self).__name__}{tuple(self)}"
 
 
 def transform_in_transform(t1, t2):
-    t1.angle *= -1
-    rotated_position = t1.angle_point(t2.position[0], t2.position[1])
-    t1.angle *= -1
-    rotated_transform = copy.copy(t2)
-    rotated_transform.position = (rotated_position[0] * t1.scale[0],
-                                  rotated_position[1] * t1.scale[1])
+    """Returns the transform of ``t2`` placed inside of ``t1``.
+    Its matrices are the products of the matrices of both, the other attributes are kept as an approximation
+    for the cases where the product can't be expressed as a single transform (rotations in non uniform scales)"""
+    cos = math.cos(t1.angle)
+    sin = math.sin(t1.angle)
 
-    # rotated_transform += Transform(position=(t1.anchor[0] * t1.scale[0], t1.anchor[1] * t1.scale[1]))
+    x, y = t2.position
+    anchor_x = t1.anchor[0] * t1.scale[0]
+    anchor_y = t1.anchor[1] * t1.scale[1]
 
-    rotated_transform += t1
-    rotated_transform.anchor = t2.anchor
+    result = Transform(scale=(
+        t2.scale[0] * t1.scale[0],
+        t2.scale[1] * t1.scale[1]
+    ), position=(
+        (cos * x + sin * y) * t1.scale[0] + t1.position[0] - (cos * anchor_x + sin * anchor_y),
+        (cos * y - sin * x) * t1.scale[1] + t1.position[1] - (cos * anchor_y - sin * anchor_x)
+    ), angle=t2.angle + t1.angle, anchor=t2.anchor)
 
-    t1.angle *= -1
-    rotated_transform -= Transform(position=t1.angle_point(t1.anchor[0] * t1.scale[0], t1.anchor[1] * t1.scale[1]))
-    t1.angle *= -1
+    result._m = t1.matrix() @ t2.matrix()
+    result._rm = t2.reverse_matrix() @ t1.reverse_matrix()
 
-    return rotated_transform
+    return result
 
 
 class Transform:
@@ -45,6 +105,13 @@ class Transform:
 
         self._rm = None
         self._m = None
+        # incremented on every change, so transforms derived from this one know when to be computed again
+        self.version = 0
+
+    def _changed(self):
+        self._rm = None
+        self._m = None
+        self.version += 1
 
     @property
     def anchor(self):
@@ -53,8 +120,7 @@ class Transform:
     @anchor.setter
     def anchor(self, value):
         self._anchor = value
-        self._rm = None
-        self._m = None
+        self._changed()
 
     @property
     def angle(self):
@@ -63,8 +129,7 @@ class Transform:
     @angle.setter
     def angle(self, value):
         self._angle = value % (math.pi * 2)
-        self._rm = None
-        self._m = None
+        self._changed()
 
     @property
     def position(self):
@@ -73,8 +138,7 @@ class Transform:
     @position.setter
     def position(self, value):
         self._position = value
-        self._rm = None
-        self._m = None
+        self._changed()
 
     @property
     def scale(self):
@@ -83,8 +147,7 @@ class Transform:
     @scale.setter
     def scale(self, value):
         self._scale = value
-        self._rm = None
-        self._m = None
+        self._changed()
 
     def __add__(self, other):
         if isinstance(other, Transform):
@@ -142,96 +205,62 @@ class Transform:
         anchor, angle, position, scale = self.anchor, self.angle, self.position, self.scale
         return f"{type(self).__name__}({scale=}, {position=}, {angle=}, {anchor=})"
 
-    def matrix(self):
+    def matrix(self) -> Affine:
         if self._m is None:
-            translation = np.array([
-                [1, 0, self.position[0] - self.anchor[0]],
-                [0, 1, self.position[1] - self.anchor[1]],
-                [0, 0, 1]
-            ])
-
-            anchor_matrix = np.array([
-                [1, 0, self.anchor[0]],
-                [0, 1, self.anchor[1]],
-                [0, 0, 1]
-            ])
-
-            anchor_i = np.array([
-                [1, 0, -self.anchor[0]],
-                [0, 1, -self.anchor[1]],
-                [0, 0, 1]
-            ])
-
-            rotation = np.array([
-                [math.cos(self.angle), math.sin(self.angle), 0],
-                [-math.sin(self.angle), math.cos(self.angle), 0],
-                [0, 0, 1]
-            ])
-
-            scale = np.array([
-                [self.scale[0], 0, 0],
-                [0, self.scale[1], 0],
-                [0, 0, 1]
-            ])
-
-            self._m = np.dot(translation, np.dot(anchor_matrix, np.dot(scale, np.dot(rotation, anchor_i))))
+            # translation(position) * scale * rotation * translation(-anchor)
+            cos = math.cos(self.angle)
+            sin = math.sin(self.angle)
+
+            a = self.scale[0] * cos
+            b = self.scale[0] * sin
+            d = -self.scale[1] * sin
+            e = self.scale[1] * cos
+
+            self._m = Affine(a, b, self.position[0] - a * self.anchor[0] - b * self.anchor[1],
+                             d, e, self.position[1] - d * self.anchor[0] - e * self.anchor[1])
 
         return self._m
 
-    def reverse_matrix(self):
+    def reverse_matrix(self) -> Affine:
         if self._rm is None:
-            translation = np.array([
-                [1, 0, -self.position[0] + self.anchor[0]],
-                [0, 1, -self.position[1] + self.anchor[1]],
-                [0, 0, 1]
-            ])
-
-            anchor_matrix = np.array([
-                [1, 0, -self.anchor[0]],
-                [0, 1, -self.anchor[1]],
-                [0, 0, 1]
-            ])
-
-            anchor_i = np.array([
-                [1, 0, self.anchor[0]],
-                [0, 1, self.anchor[1]],
-                [0, 0, 1]
-            ])
-
-            rotation = np.array([
-                [math.cos(-self.angle), math.sin(-self.angle), 0],
-                [-math.sin(-self.angle), math.cos(-self.angle), 0],
-                [0, 0, 1]
-            ])
-
-            scale = np.array([
-                [1 / self.scale[0], 0, 0],
-                [0, 1 / self.scale[1], 0],
-                [0, 0, 1]
-            ])
-
-            self._rm = np.dot(anchor_i, np.dot(rotation, np.dot(scale, np.dot(anchor_matrix, translation))))
+            # translation(anchor) * rotation(-angle) * scale(1 / scale) * translation(-position)
+            cos = math.cos(self.angle)
+            sin = math.sin(self.angle)
+
+            a = cos / self.scale[0]
+            b = -sin / self.scale[1]
+            d = sin / self.scale[0]
+            e = cos / self.scale[1]
+
+            self._rm = Affine(a, b, self.anchor[0] - a * self.position[0] - b * self.position[1],
+                              d, e, self.anchor[1] - d * self.position[0] - e * self.position[1])
 
         return self._rm
 
     def solve_reverse(self, pos):
-        return _solve(pos, self.reverse_matrix())
+        return self.reverse_matrix().solve(pos)
 
     def solve(self, pos):
-        return _solve(pos, self.matrix())
+        return self.matrix().solve(pos)
+
+    def solve_many(self, points) -> np.ndarray:
+        return self.matrix().solve_many(points)
 
     @classmethod
     def default(cls):
         return cls()
 
+    def is_identity(self):
+        return self.scale == (1, 1) and self.position == (0, 0) and self.angle == 0 and self.anchor == (0, 0)
+
     def __iter__(self):
         yield from self.reverse_matrix_values()
 
     def reverse_matrix_values(self):
-        yield from _values_from_matrix(self.reverse_matrix())
+        yield from self.reverse_matrix()
 
     def matrix_values(self):
-        yield from _values_from_matrix(self.matrix())
+        yield from self.matrix()
 
     def angle_point(self, x, y):
         qx = math.cos(self.angle) * x - math.sin(self.angle) * y
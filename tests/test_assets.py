@@ -0,0 +1,26 @@
+from PIL import Image
+
+from render.assets import AssetCache
+from render.scene import Scene
+
+
+def test_image_shared_by_another_cache_outlives_scene(tmp_path):
+    path = tmp_path / "sticker.png"
+    Image.new("RGBA", (8, 8), (255, 0, 0, 255)).save(path)
+
+    cache = AssetCache()
+
+    class StickerScene(Scene):
+        def lifecycle(self, t):
+            self.width = 16
+            self.height = 16
+
+            self.draw_object(self.create_image(cache.load_image(path)))
+
+            return 0
+
+    for _ in range(2):
+        # frames are pooled images, they are only readable until the scene ends
+        pixels = [image.getpixel((0, 0)) for image, _ in StickerScene()]
+
+        assert pixels == [(255, 0, 0, 255)]
@@ -0,0 +1,54 @@
+import pytest
+from PIL import Image
+
+from render.scene import Scene
+
+
+class TransformedScene(Scene):
+    def lifecycle(self, t):
+        self.width = 96
+        self.height = 64
+
+        labels = []
+
+        for index, scale in enumerate((1.1, 1.125, 1.175)):
+            label = self.create_text("region")
+            label.transform.position = (3 + index * 7, 4 + index * 19)
+            label.transform.scale = (scale, scale)
+            self.draw_object(label)
+            labels.append(label)
+
+        rectangle = self.create_rectangle(30, 12, (255, 0, 0))
+        rectangle.transform.position = (48, 30)
+        rectangle.transform.anchor = (15, 6)
+        self.draw_object(rectangle)
+
+        sticker = self.create_image(Image.linear_gradient("L").resize((24, 24)).convert("RGBA"))
+        sticker.transform.position = (70, 20)
+        sticker.transform.anchor = (12, 12)
+        self.draw_object(sticker)
+
+        def u(value):
+            rectangle.transform.angle = value
+            sticker.transform.angle = -value
+            sticker.transform.scale = (1 + value / 5, 1 + value / 7)
+            labels[0].transform.position = (3 + value * 9, 4)
+
+        self.create_tween("linear", u, duration=0.5, end_value=2)
+
+        return 0
+
+
+def render(**attributes):
+    scene = TransformedScene()
+
+    for name, value in attributes.items():
+        setattr(scene, name, value)
+
+    # frames are pooled images, they are only readable until the next frame
+    return [(image.tobytes(), duration) for image, duration in scene]
+
+
+@pytest.mark.parametrize("attributes", [{"tile_size": 16}, {"tile_size": 40}, {"incremental_rendering": True}])
+def test_regions_match_full_render(attributes):
+    assert render(**attributes) == render()
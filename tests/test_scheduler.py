@@ -0,0 +1,60 @@
+from render.scene import Scene
+from render.scheduler import Scheduler
+
+
+class _Update:
+    def __init__(self, second, required):
+        self.second = second
+        self.required = required
+
+    def get_next_update(self, t):
+        if self.second > t:
+            return self.second, lambda _: None, self.required
+
+        return None
+
+
+def test_required_update_after_non_required_one():
+    scheduler = Scheduler()
+    scheduler.add(_Update(1, True))
+    scheduler.add(_Update(0.5, False))
+
+    second, funcs, required = scheduler.pop_next(0, first_frame=True)
+    assert (second, len(funcs), required) == (0.5, 1, True)
+
+    second, funcs, required = scheduler.pop_next(second)
+    assert (second, len(funcs), required) == (1, 1, True)
+
+    second, funcs, required = scheduler.pop_next(second)
+    assert (second, funcs, required) == (float("inf"), [], False)
+
+
+def test_removed_required_update_is_not_counted():
+    scheduler = Scheduler()
+    required_update = _Update(1, True)
+    scheduler.add(required_update)
+    scheduler.add(_Update(0.5, False))
+    scheduler.pop_next(0, first_frame=True)
+
+    scheduler.remove(required_update)
+
+    assert scheduler.pop_next(0)[2] is False
+
+
+def test_scene_runs_until_last_required_tween():
+    class MixedScene(Scene):
+        def lifecycle(self, t):
+            self.width = 10
+            self.height = 10
+
+            self.create_tween("linear", lambda _: None, duration=1)
+            self.create_tween("linear", lambda _: None, duration=1, start_second=0.5, required=False)
+
+            return 0
+
+    scene = MixedScene()
+
+    for _ in scene:
+        pass
+
+    assert scene.current_second == 1